@@ -8,6 +8,24 @@ import L from 'leaflet';
 // FORZAMOS LA URL DE INTELIGENCIA (RENDER)
 const API_URL = 'https://mml-control-backend.onrender.com';
 
+// Lists are paginated by cursor: follow X-Next-Cursor until the last page
+const fetchAllPages = async (url, token) => {
+    let items = [];
+    let cursor = null;
+    do {
+        const res = await axios.get(url, {
+            headers: { Authorization: `Bearer ${token}` },
+            params: cursor ? { cursor } : {}
+        });
+        items = items.concat(res.data);
+        cursor = res.headers['x-next-cursor'];
+    } while (cursor);
+    return items;
+};
+
+// Shift history is loaded one page at a time, most recent first
+const HISTORY_PAGE_SIZE = 100;
+
 function App() {
     const [token, setToken] = useState(localStorage.getItem('token'));
     const [workers, setWorkers] = useState([]);
@@ -198,28 +216,70 @@ function LiveMap({ setWorkers, token }) {
     const [mapCenter, setMapCenter] = useState([42.5987, -5.5671]); // León, España
 
     useEffect(() => {
-        const fetch = async () => {
+        // Live stream: one snapshot, then only position / shift deltas
+        const workersById = new Map();
+        const publish = () => {
+            const list = Array.from(workersById.values()).filter(w => w.lat !== null);
+            setMarkers(list);
+            setWorkers(list);
+        };
+        const upsert = (e) => {
+            const { worker } = JSON.parse(e.data);
+            workersById.set(worker.user_id, worker);
+            publish();
+        };
+
+        // The stream URL carries a short-lived token that only opens this stream, never the session token
+        let source = null;
+        let retry = null;
+        let closed = false;
+        const connect = async () => {
             try {
-                const res = await axios.get(`${API_URL}/admin/workers-map`, {
+                const res = await axios.post(`${API_URL}/admin/workers-map/stream-token`, null, {
                     headers: { Authorization: `Bearer ${token}` }
                 });
-                setMarkers(res.data);
-                setWorkers(res.data);
-
-                // Dynamic map centering: if workers active, center on them
-                if (res.data.length > 0) {
-                    const avgLat = res.data.reduce((sum, m) => sum + m.lat, 0) / res.data.length;
-                    const avgLng = res.data.reduce((sum, m) => sum + m.lng, 0) / res.data.length;
-                    setMapCenter([avgLat, avgLng]);
-                }
-            } catch (e) {
-                console.error(e);
+                if (closed) return;
+                source = new EventSource(`${API_URL}/admin/workers-map/stream?token=${encodeURIComponent(res.data.token)}`);
+                source.addEventListener('snapshot', (e) => {
+                    const data = JSON.parse(e.data);
+                    workersById.clear();
+                    data.forEach(w => workersById.set(w.user_id, w));
+                    publish();
+
+                    // Dynamic map centering: if workers active, center on them
+                    if (data.length > 0) {
+                        const avgLat = data.reduce((sum, m) => sum + m.lat, 0) / data.length;
+                        const avgLng = data.reduce((sum, m) => sum + m.lng, 0) / data.length;
+                        setMapCenter([avgLat, avgLng]);
+                    }
+                });
+                source.addEventListener('position', upsert);
+                source.addEventListener('shift_start', upsert);
+                source.addEventListener('shift_end', (e) => {
+                    const { user_id } = JSON.parse(e.data);
+                    workersById.delete(user_id);
+                    publish();
+                });
+                // EventSource reconnects on its own and receives a fresh snapshot. Once the stream
+                // token has expired it gives up (401), so fetch a new one.
+                source.onerror = (e) => {
+                    console.error(e);
+                    if (source.readyState === EventSource.CLOSED && !closed) {
+                        retry = setTimeout(connect, 2000);
+                    }
+                };
+            } catch (err) {
+                console.error(err);
+                if (!closed) retry = setTimeout(connect, 5000);
             }
         };
+        connect();
 
-        fetch(); // Initial
-        const interval = setInterval(fetch, 5000); // Poll every 5s
-        return () => clearInterval(interval);
+        return () => {
+            closed = true;
+            clearTimeout(retry);
+            if (source) source.close();
+        };
     }, [token]);
 
     // Vehicle icons
@@ -265,9 +325,9 @@ function LiveMap({ setWorkers, token }) {
                     url="https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png"
                     attribution='&copy; <a href="https://carto.com/">CARTO</a>'
                 />
-                {markers.map((m, i) => (
+                {markers.map((m) => (
                     <Marker
-                        key={i}
+                        key={m.user_id}
                         position={[m.lat, m.lng]}
                         icon={createVehicleIcon(m.vehicle_type || 'car', m.worker_number || '?')}
                     >
@@ -292,10 +352,7 @@ function WorkersManagement({ token }) {
 
     const fetchWorkers = async () => {
         try {
-            const res = await axios.get(`${API_URL}/admin/workers`, {
-                headers: { Authorization: `Bearer ${token}` }
-            });
-            setWorkers(res.data);
+            setWorkers(await fetchAllPages(`${API_URL}/admin/workers`, token));
         } catch (e) {
             console.error("Error fetching workers", e);
         }
@@ -422,27 +479,34 @@ function ShiftsHistory({ token }) {
     const [shifts, setShifts] = useState([]);
     const [searchTerm, setSearchTerm] = useState('');
     const [dateFilter, setDateFilter] = useState('');
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loading, setLoading] = useState(false);
+
+    // Sorted by the server (order=recent), the next page comes from X-Next-Cursor
+    const fetchShifts = async (cursor = null) => {
+        setLoading(true);
+        try {
+            const res = await axios.get(`${API_URL}/admin/shifts`, {
+                headers: { Authorization: `Bearer ${token}` },
+                params: { order: 'recent', limit: HISTORY_PAGE_SIZE, ...(cursor ? { cursor } : {}) }
+            });
+            setShifts(prev => cursor ? prev.concat(res.data) : res.data);
+            setNextCursor(res.headers['x-next-cursor'] || null);
+        } catch (e) {
+            console.error("Error fetching shifts", e);
+        } finally {
+            setLoading(false);
+        }
+    };
 
     useEffect(() => {
-        const fetchShifts = async () => {
-            try {
-                const res = await axios.get(`${API_URL}/admin/shifts`, {
-                    headers: { Authorization: `Bearer ${token}` }
-                });
-                // Sort by start time desc
-                const sorted = res.data.sort((a, b) => new Date(b.start_time) - new Date(a.start_time));
-                setShifts(sorted);
-            } catch (e) {
-                console.error("Error fetching shifts", e);
-            }
-        };
         fetchShifts();
     }, [token]);
 
-    // Filter shifts based on search and date
+    // Filter the loaded shifts based on search and date
     const filteredShifts = shifts.filter(s => {
-        const matchesSearch = s.worker_name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-            s.worker_number.toString().includes(searchTerm);
+        const matchesSearch = (s.worker_name || '').toLowerCase().includes(searchTerm.toLowerCase()) ||
+            String(s.worker_number ?? '').includes(searchTerm);
         const matchesDate = !dateFilter || new Date(s.start_time).toLocaleDateString('es-ES') === new Date(dateFilter).toLocaleDateString('es-ES');
         return matchesSearch && matchesDate;
     });
@@ -485,7 +549,7 @@ function ShiftsHistory({ token }) {
             const duration = end ? ((end - start) / 1000 / 60 / 60).toFixed(2) + ' hrs' : '-';
             return `
                                 <tr>
-                                    <td><strong>${s.worker_name}</strong><br><small>#${s.worker_number}</small></td>
+                                    <td><strong>${s.worker_name || ''}</strong><br><small>#${s.worker_number ?? ''}</small></td>
                                     <td>${start.toLocaleString('es-ES')}</td>
                                     <td>${end ? end.toLocaleString('es-ES') : '-'}</td>
                                     <td>${duration}</td>
@@ -535,7 +599,7 @@ function ShiftsHistory({ token }) {
                 </div>
                 <div className="mt-4 flex justify-between items-center">
                     <p className="text-sm text-gray-700">
-                        <strong>Mostrando {filteredShifts.length}</strong> de {shifts.length} jornadas
+                        <strong>Mostrando {filteredShifts.length}</strong> de {shifts.length} jornadas cargadas
                     </p>
                     <button
                         onClick={handleExportPDF}
@@ -583,6 +647,17 @@ function ShiftsHistory({ token }) {
                     </tbody>
                 </table>
                 {filteredShifts.length === 0 && <div className="p-8 text-center text-gray-600 font-medium">No se encontraron jornadas que coincidan con tu búsqueda.</div>}
+                {nextCursor && (
+                    <div className="p-4 text-center border-t">
+                        <button
+                            onClick={() => fetchShifts(nextCursor)}
+                            disabled={loading}
+                            className="bg-gray-900 text-white px-6 py-2 rounded-lg font-bold hover:bg-gray-700 transition disabled:opacity-50"
+                        >
+                            {loading ? 'Cargando...' : 'Cargar más jornadas'}
+                        </button>
+                    </div>
+                )}
             </div>
         </div>
     );
@@ -692,10 +767,7 @@ function ReportsView({ token }) {
 
     const fetchWorkers = async () => {
         try {
-            const res = await axios.get(`${API_URL}/admin/workers`, {
-                headers: { Authorization: `Bearer ${token}` }
-            });
-            setWorkers(res.data);
+            setWorkers(await fetchAllPages(`${API_URL}/admin/workers`, token));
         } catch (e) {
             console.error(e);
         }
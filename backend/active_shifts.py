@@ -0,0 +1,69 @@
+import threading
+from collections import namedtuple
+import models
+
+ActiveShift = namedtuple("ActiveShift", ["id", "start_time"])
+
+
+class ActiveShiftRegistry:
+    """Authoritative user_id -> active shift map for this process.
+
+    Loaded at startup and updated only after the shift change has been committed,
+    so the ingest privacy check is a dictionary lookup instead of a `shifts` query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shifts = {}
+        # Serialises start/end so check + commit + registry update happen as one step
+        self.transition_lock = threading.Lock()
+
+    def load(self, db):
+        shifts = self._query_active(db)
+        with self._lock:
+            self._shifts = shifts
+        return len(shifts)
+
+    def get(self, user_id):
+        return self._shifts.get(user_id)
+
+    def started(self, user_id, shift_id, start_time):
+        with self._lock:
+            self._shifts[user_id] = ActiveShift(shift_id, start_time)
+
+    def ended(self, user_id, shift_id=None):
+        with self._lock:
+            current = self._shifts.get(user_id)
+            if current is not None and (shift_id is None or current.id == shift_id):
+                del self._shifts[user_id]
+
+    def reconcile(self, db):
+        """Compares the registry with the database, repairs it and reports the differences."""
+        with self.transition_lock:
+            expected = self._query_active(db)
+            with self._lock:
+                missing = [user_id for user_id in expected if user_id not in self._shifts]
+                stale = [user_id for user_id in self._shifts if user_id not in expected]
+                mismatched = [
+                    user_id for user_id, shift in self._shifts.items()
+                    if user_id in expected and expected[user_id] != shift
+                ]
+                self._shifts = expected
+        return {
+            "active_shifts": len(expected),
+            "consistent": not (missing or stale or mismatched),
+            "missing": missing,
+            "stale": stale,
+            "mismatched": mismatched
+        }
+
+    def __len__(self):
+        return len(self._shifts)
+
+    @staticmethod
+    def _query_active(db):
+        rows = db.query(models.Shift.id, models.Shift.user_id, models.Shift.start_time).filter(
+            models.Shift.status == "active"
+        ).order_by(models.Shift.id.desc()).all()
+        # If a user has several open shifts, keep the oldest one (the one end_shift used to close first)
+        return {user_id: ActiveShift(shift_id, start_time) for shift_id, user_id, start_time in rows}
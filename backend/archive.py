@@ -0,0 +1,113 @@
+import json
+import os
+import stat
+import zipfile
+from datetime import date
+import track_codec
+
+# Read-only cold storage for GPS tracks of old shifts (see tracks.archive_old_shifts).
+#
+# One zip per shift start day (plus numbered parts for later runs) under
+# ARCHIVE_DIR/YYYY/MM/, holding each shift's track_codec blob as "<shift_id>.track"
+# and a manifest.json. Shifts remember the file in `archive_path` (relative to
+# ARCHIVE_DIR), so a track is one zip member read away.
+#
+# The hot rows are deleted once a track is archived, so the files are the only copy:
+# MML_ARCHIVE_DIR must be an absolute path on persistent storage (a mounted disk, not
+# the app's working directory, which is ephemeral on Render). There is no default.
+ARCHIVE_DIR = os.getenv("MML_ARCHIVE_DIR")
+MANIFEST = "manifest.json"
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def require_location():
+    """Raises ArchiveError unless ARCHIVE_DIR is an absolute path to an existing, writable directory."""
+    if not ARCHIVE_DIR:
+        raise ArchiveError("MML_ARCHIVE_DIR is not set: configure a persistent archive location first")
+    if not os.path.isabs(ARCHIVE_DIR):
+        raise ArchiveError(f"MML_ARCHIVE_DIR must be an absolute path on persistent storage, got {ARCHIVE_DIR!r}")
+    if not os.path.isdir(ARCHIVE_DIR) or not os.access(ARCHIVE_DIR, os.W_OK):
+        raise ArchiveError(f"MML_ARCHIVE_DIR {ARCHIVE_DIR} is not a writable directory (is the disk mounted?)")
+
+
+def _member(shift_id: int):
+    return f"{shift_id}.track"
+
+
+def _full_path(relative_path: str):
+    if not ARCHIVE_DIR:
+        raise ArchiveError("MML_ARCHIVE_DIR is not set")
+    return os.path.join(ARCHIVE_DIR, relative_path)
+
+
+def _new_relative_path(day: date):
+    folder = os.path.join(f"{day.year:04d}", f"{day.month:02d}")
+    os.makedirs(_full_path(folder), exist_ok=True)
+    part = 0
+    while True:
+        name = f"locations-{day.isoformat()}" + (f".{part}" if part else "") + ".zip"
+        relative = os.path.join(folder, name)
+        if not os.path.exists(_full_path(relative)):
+            return relative
+        part += 1
+
+
+def write_day(day: date, tracks):
+    """Writes one read-only archive file for `day`. `tracks` is a list of (manifest entry, encoded blob).
+
+    Returns the path to store in shifts.archive_path. The file is complete (fsynced,
+    renamed into place and read back by verify) before this returns.
+    """
+    relative = _new_relative_path(day)
+    path = _full_path(relative)
+    tmp = path + ".tmp"
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for entry, encoded in tracks:
+            archive.writestr(_member(entry["shift_id"]), encoded)
+        archive.writestr(MANIFEST, json.dumps([entry for entry, _ in tracks], default=str))
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    verify(relative, {entry["shift_id"]: encoded for entry, encoded in tracks})
+    return relative
+
+
+def verify(relative_path: str, expected):
+    """Reads an archive file back; raises ArchiveError unless it holds every expected track.
+
+    `expected` maps shift id to the encoded blob that was written (compared byte for byte)
+    or to None, in which case the member must pass its CRC check and decode to the point
+    count in the manifest.
+    """
+    try:
+        with zipfile.ZipFile(_full_path(relative_path)) as archive:
+            if archive.testzip() is not None:
+                raise ArchiveError(f"Corrupt member in {relative_path}")
+            point_counts = {entry["shift_id"]: entry["point_count"] for entry in json.loads(archive.read(MANIFEST))}
+            for shift_id, encoded in expected.items():
+                stored = archive.read(_member(shift_id))
+                if encoded is not None and stored != encoded:
+                    raise ArchiveError(f"Track of shift {shift_id} differs in {relative_path}")
+                if encoded is None and len(track_codec.decode(stored)) != point_counts.get(shift_id):
+                    raise ArchiveError(f"Track of shift {shift_id} is incomplete in {relative_path}")
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        raise ArchiveError(f"Archive {relative_path} failed verification") from e
+
+
+def iter_tracks(relative_path: str, shift_ids):
+    """Yields (shift_id, [(timestamp, latitude, longitude)]) from one archive file, opened once."""
+    try:
+        with zipfile.ZipFile(_full_path(relative_path)) as archive:
+            for shift_id in shift_ids:
+                yield shift_id, track_codec.decode(archive.read(_member(shift_id)))
+    except (OSError, KeyError, zipfile.BadZipFile) as e:
+        raise ArchiveError(f"Archived track unavailable in {relative_path}") from e
+
+
+def read_track(relative_path: str, shift_id: int):
+    for _, points in iter_tracks(relative_path, [shift_id]):
+        return points
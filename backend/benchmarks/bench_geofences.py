@@ -0,0 +1,105 @@
+"""Geofence evaluation throughput: naive loop vs the indexed live path vs batch replay.
+
+Generates polygon and circle fences over the city and riders doing random walks,
+then measures pings per second for:
+  naive  every ping against every fence in pure Python (no index)
+  live   GeofenceMonitor.observe, one ping at a time as on /location
+  batch  geofences.track_events over whole tracks (historical replay, /location/batch)
+Run from backend/:
+    python -m benchmarks.bench_geofences --fences 10 100 1000 --pings 50000
+"""
+import argparse
+import math
+import random
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+import geo_index, geofences
+from benchmarks.seed import CENTER, EPOCH
+
+
+def make_fences(count, spread, rng):
+    fences = []
+    for fence_id in range(1, count + 1):
+        lat, lng = CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)
+        if fence_id % 3 == 0:
+            fences.append(SimpleNamespace(id=fence_id, shape="circle", points=None, center_lat=lat, center_lng=lng,
+                                          radius_m=rng.uniform(30, 400), company_id=1))
+            continue
+        radius = rng.uniform(0.0005, 0.005)
+        angles = sorted(rng.uniform(0, 2 * math.pi) for _ in range(rng.randrange(6, 24)))
+        points = [[lat + radius * rng.uniform(0.5, 1) * math.sin(a), lng + radius * rng.uniform(0.5, 1) * math.cos(a)] for a in angles]
+        fences.append(SimpleNamespace(id=fence_id, shape="polygon", points=points, center_lat=None, center_lng=None, radius_m=None, company_id=1))
+    return fences
+
+
+def make_tracks(riders, pings, spread, rng):
+    tracks = []
+    for _ in range(riders):
+        lat, lng = CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)
+        track = []
+        for i in range(pings // riders):
+            lat += rng.uniform(-0.0004, 0.0004)  # ~40 m per 10 s ping
+            lng += rng.uniform(-0.0004, 0.0004)
+            track.append((EPOCH + timedelta(seconds=10 * i), lat, lng))
+        tracks.append(track)
+    return tracks
+
+
+def naive_inside(fence, lat, lng):
+    if fence.shape == "circle":
+        return geo_index.haversine_m(lat, lng, fence.center_lat, fence.center_lng) <= fence.radius_m
+    inside = False
+    points = fence.points
+    for (lat1, lng1), (lat2, lng2) in zip(points, points[1:] + points[:1]):
+        if (lat1 > lat) != (lat2 > lat) and lng < lng1 + (lat - lat1) * (lng2 - lng1) / (lat2 - lat1):
+            inside = not inside
+    return inside
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fences", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--pings", type=int, default=50000)
+    parser.add_argument("--riders", type=int, default=70)
+    parser.add_argument("--spread", type=float, default=0.1, help="Degrees around the city centre")
+    parser.add_argument("--naive-pings", type=int, default=2000, help="Pings timed for the naive loop (it is slow)")
+    args = parser.parse_args()
+
+    print(f"{args.pings} pings from {args.riders} riders, fences within +/-{args.spread} deg; pings per second")
+    print(f"{'fences':>7} | {'naive':>9} | {'live':>9} | {'batch':>10} | {'events':>7} | live = batch")
+    for count in args.fences:
+        rng = random.Random(count)
+        fences = make_fences(count, args.spread, rng)
+        compiled = geofences.CompiledFences(fences)
+        tracks = make_tracks(args.riders, args.pings, args.spread, rng)
+        pings = sum(len(track) for track in tracks)
+
+        sample = [point for track in tracks for point in track][:args.naive_pings]
+        started = time.perf_counter()
+        for _, lat, lng in sample:
+            [fence.id for fence in fences if naive_inside(fence, lat, lng)]
+        naive = len(sample) / (time.perf_counter() - started)
+
+        monitor = geofences.GeofenceMonitor()
+        monitor._fences = compiled
+        live_events = []
+        started = time.perf_counter()
+        for user_id, track in enumerate(tracks):
+            for timestamp, lat, lng in track:
+                live_events += monitor.observe(user_id, 1, lat, lng, timestamp)
+        live = pings / (time.perf_counter() - started)
+
+        batch_events = []
+        started = time.perf_counter()
+        for user_id, track in enumerate(tracks):
+            batch_events += geofences.track_events(compiled, user_id, 1, track)[0]
+        batch = pings / (time.perf_counter() - started)
+
+        same = sorted((e["user_id"], e["timestamp"], e["geofence_id"], e["event"]) for e in live_events) == \
+            sorted((e["user_id"], e["timestamp"], e["geofence_id"], e["event"]) for e in batch_events)
+        print(f"{count:>7} | {naive:>9.0f} | {live:>9.0f} | {batch:>10.0f} | {len(batch_events):>7} | {same}")
+
+
+if __name__ == "__main__":
+    main()
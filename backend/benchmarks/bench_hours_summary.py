@@ -0,0 +1,106 @@
+"""Latency and peak memory of /admin/reports/hours_summary: Python loop vs SQL GROUP BY vs daily rollup.
+
+Run from backend/:
+    python -m benchmarks.bench_hours_summary --scales 10000 100000 1000000
+"""
+import argparse
+import math
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import models, migrations, queries, rollups
+from benchmarks.seed import seed
+
+USERS = 70
+
+
+def legacy_hours_summary(db):
+    """The endpoint before it moved to SQL (kept here as the reference result)."""
+    shifts = db.query(models.Shift).filter(models.Shift.status == "completed").all()
+    summary = {}
+    for s in shifts:
+        if s.worker.id not in summary:
+            summary[s.worker.id] = {
+                "worker_name": s.worker.full_name,
+                "worker_number": s.worker.worker_number,
+                "total_hours": 0,
+                "shift_count": 0
+            }
+        if s.end_time:
+            duration = (s.end_time - s.start_time).total_seconds() / 3600
+            summary[s.worker.id]["total_hours"] += duration
+            summary[s.worker.id]["shift_count"] += 1
+    return list(summary.values())
+
+
+def sql_hours_summary(db):
+    return queries.hours_summary(db)
+
+
+def rollup_hours_summary(db):
+    return rollups.rollup_hours_summary(db)
+
+
+def run(session_factory, report, repeat):
+    timings = []
+    for _ in range(repeat):
+        db = session_factory()
+        started = time.perf_counter()
+        result = report(db)
+        timings.append((time.perf_counter() - started) * 1000)
+        db.close()
+
+    db = session_factory()
+    tracemalloc.start()
+    report(db)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.close()
+    return result, statistics.median(timings), peak / 1024 / 1024
+
+
+def same_result(a, b):
+    if len(a) != len(b):
+        return False
+    key = lambda row: (row["worker_number"] is None, row["worker_number"], row["worker_name"])
+    for x, y in zip(sorted(a, key=key), sorted(b, key=key)):
+        if (x["worker_name"], x["worker_number"], x["shift_count"]) != (y["worker_name"], y["worker_number"], y["shift_count"]):
+            return False
+        if not math.isclose(x["total_hours"], y["total_hours"], rel_tol=1e-9, abs_tol=1e-9):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000, 100000, 1000000], help="Number of shifts")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    print(f"{'shifts':>9} | {'legacy ms':>10} {'legacy MB':>10} | {'sql ms':>8} {'sql MB':>7} | "
+          f"{'rollup ms':>9} {'rollup MB':>9} | same result")
+    for scale in args.scales:
+        engine = create_engine(f"sqlite:///{os.path.join(workdir, f'hours_{scale}.db')}")
+        migrations.run_migrations(engine)
+        days = max(1, round(scale / (USERS * 0.85)))
+        counts = seed(engine, users=USERS, days=days, locations=0)
+        session_factory = sessionmaker(bind=engine)
+        with session_factory() as db:
+            rollups.rebuild(db)
+            db.commit()
+
+        legacy, legacy_ms, legacy_mb = run(session_factory, legacy_hours_summary, args.repeat)
+        sql, sql_ms, sql_mb = run(session_factory, sql_hours_summary, args.repeat)
+        rollup, rollup_ms, rollup_mb = run(session_factory, rollup_hours_summary, args.repeat)
+        same = same_result(legacy, sql) and same_result(legacy, rollup)
+        print(f"{counts['shifts']:>9} | {legacy_ms:>10.1f} {legacy_mb:>10.1f} | {sql_ms:>8.1f} {sql_mb:>7.2f} | "
+              f"{rollup_ms:>9.1f} {rollup_mb:>9.2f} | {same}")
+
+
+if __name__ == "__main__":
+    main()
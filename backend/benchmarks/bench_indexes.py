@@ -0,0 +1,84 @@
+"""Query plans and timings of the hot-path queries before/after migration 3 (indexes).
+
+Seeds a SQLite file without the hot-path indexes, measures, applies the index
+migration and measures again. Run from backend/:
+    python -m benchmarks.bench_indexes --locations 2000000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from sqlalchemy import create_engine, text
+import models, migrations
+from benchmarks.seed import EPOCH, seed
+
+QUERIES = {
+    "active shift of user": (
+        "SELECT id FROM shifts WHERE user_id = :user_id AND status = 'active'", {"user_id": 10}),
+    "all active shifts": (
+        "SELECT id, user_id, start_time FROM shifts WHERE status = 'active'", {}),
+    "shifts started in a day": (
+        "SELECT id, user_id, start_time, end_time FROM shifts WHERE start_time >= :start AND start_time < :end",
+        {"start": EPOCH + timedelta(days=20), "end": EPOCH + timedelta(days=21)}),
+    "last location of shift": (
+        "SELECT latitude, longitude, timestamp FROM locations WHERE shift_id = :shift_id ORDER BY timestamp DESC LIMIT 1",
+        {"shift_id": 1234}),
+    "track of shift": (
+        "SELECT latitude, longitude, timestamp FROM locations WHERE shift_id = :shift_id ORDER BY timestamp",
+        {"shift_id": 1234}),
+}
+
+
+def measure(engine, repeat):
+    results = {}
+    with engine.connect() as conn:
+        for name, (sql, params) in QUERIES.items():
+            plan = [" ".join(str(col) for col in row[1:]) for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql), params)]
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                conn.execute(text(sql), params).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = {"plan": plan, "median_ms": statistics.median(timings), "max_ms": max(timings)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="SQLite file to use (default: temporary file)")
+    parser.add_argument("--users", type=int, default=70)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--locations", type=int, default=2000000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "bench_indexes.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name in migrations.HOT_PATH_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    started = time.perf_counter()
+    counts = seed(engine, args.users, args.days, args.locations)
+    print(f"Seeded {counts} in {time.perf_counter() - started:.1f}s ({path})")
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+    before = measure(engine, args.repeat)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        migrations._hot_path_indexes(conn)
+    print(f"Index migration took {time.perf_counter() - started:.1f}s")
+    after = measure(engine, args.repeat)
+
+    for name in QUERIES:
+        print(f"\n{name}")
+        print(f"  before: {before[name]['median_ms']:9.3f} ms median  | {'; '.join(before[name]['plan'])}")
+        print(f"  after:  {after[name]['median_ms']:9.3f} ms median  | {'; '.join(after[name]['plan'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Distance / speed analytics: row-by-row Python vs the NumPy shift-metrics engine.
+
+Builds completed delivery shifts (10 h at one fix per 15 s, see bench_tracks) with a
+few injected GPS jumps, then times the per-worker distance summary computed
+  rows      ORM LocationLog rows per shift, haversine in a Python loop (no jump filter)
+  numpy     shift_metrics.fill_cache from raw `locations`, then again from compacted tracks
+  cached    shift_metrics.distance_summary once every shift is cached
+Run from backend/:
+    python -m benchmarks.bench_metrics --workers 10 --shifts 20
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+from sqlalchemy import create_engine, delete, insert
+from sqlalchemy.orm import sessionmaker
+import geo_index, migrations, models, shift_metrics, tracks
+from benchmarks.bench_tracks import delivery_track
+from benchmarks.seed import EPOCH
+
+
+def row_by_row(db):
+    """The straightforward version: per-worker kilometres from ORM rows."""
+    totals = {}
+    for shift in db.query(models.Shift).filter(models.Shift.status == "completed").order_by(models.Shift.id):
+        rows = db.query(models.LocationLog).filter(models.LocationLog.shift_id == shift.id).order_by(models.LocationLog.timestamp).all()
+        distance = 0.0
+        for previous, current in zip(rows, rows[1:]):
+            distance += geo_index.haversine_m(previous.latitude, previous.longitude, current.latitude, current.longitude)
+        totals[shift.user_id] = totals.get(shift.user_id, 0.0) + distance
+    return totals
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=10)
+    parser.add_argument("--shifts", type=int, default=20, help="Completed shifts per worker")
+    parser.add_argument("--jumps", type=int, default=3, help="GPS jumps injected per shift")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'metrics.db')}")
+    migrations.run_migrations(engine)
+    session_factory = sessionmaker(bind=engine)
+
+    pings = 0
+    with engine.begin() as conn:
+        conn.execute(insert(models.User.__table__), [
+            {"id": worker, "email": f"worker{worker}@bench.local", "full_name": f"Worker {worker}", "worker_number": worker, "role": "worker"}
+            for worker in range(1, args.workers + 1)
+        ])
+        shift_id = 0
+        for worker in range(1, args.workers + 1):
+            for day in range(args.shifts):
+                shift_id += 1
+                start = EPOCH + timedelta(days=day)
+                points = delivery_track(rng, start)
+                for _ in range(args.jumps):
+                    i = rng.randrange(len(points))
+                    t, lat, lng = points[i]
+                    points[i] = (t, lat + rng.choice([-1, 1]) * 0.02, lng)  # ~2 km spike
+                conn.execute(insert(models.Shift.__table__), [{
+                    "id": shift_id, "user_id": worker, "start_time": start, "end_time": points[-1][0], "status": "completed"
+                }])
+                conn.execute(insert(models.LocationLog.__table__), [
+                    {"shift_id": shift_id, "timestamp": t, "latitude": lat, "longitude": lng} for t, lat, lng in points
+                ])
+                pings += len(points)
+
+    db = session_factory()
+    rows_s, naive = timed(lambda: row_by_row(db))
+    raw_s, _ = timed(lambda: shift_metrics.fill_cache(db))
+    summary_s, summary = timed(lambda: shift_metrics.distance_summary(db))
+
+    tracks.compact_closed_shifts(db)
+    db.execute(delete(models.ShiftMetrics))
+    db.commit()
+    compact_s, _ = timed(lambda: shift_metrics.fill_cache(db))
+
+    arrays = shift_metrics.track_arrays(db, 1)
+    compute_s, _ = timed(lambda: [shift_metrics.compute(*arrays) for _ in range(50)])
+    db.close()
+
+    print(f"{shift_id} shifts, {pings} pings, {args.jumps} injected jumps per shift")
+    print(f"{'path':<34} | {'seconds':>8} | {'pings/s':>10}")
+    for name, seconds in [("row-by-row Python (ORM rows)", rows_s), ("numpy, raw locations (cold cache)", raw_s),
+                          ("numpy, compacted tracks (cold)", compact_s), ("distance_summary (warm cache)", summary_s)]:
+        print(f"{name:<34} | {seconds:>8.3f} | {pings / seconds:>10.0f}")
+    print(f"compute() alone: {len(arrays[0]) * 50 / compute_s:,.0f} pings/s")
+    worst = max(summary, key=lambda row: abs(row["distance_km"] - naive[row["worker_number"]] / 1000))
+    print(f"jump filter effect, worker {worst['worker_number']}: {naive[worst['worker_number']] / 1000:.1f} km unfiltered, "
+          f"{worst['distance_km']:.1f} km filtered")
+
+
+if __name__ == "__main__":
+    main()
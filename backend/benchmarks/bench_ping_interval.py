@@ -0,0 +1,84 @@
+"""Request volume with server-driven ping intervals vs the app's fixed 15 s timer.
+
+Simulates a fleet on a virtual clock: each rider follows a delivery track
+(bench_tracks.delivery_track: 15-45 km/h rides between 1-6 minute stops) and pings
+when told to. Every ping goes through the same StationaryFilter and PingScheduler
+as /location, and the next ping is scheduled after `next_ping_seconds`.
+  fixed      every 15 s (the app before adaptive intervals)
+  adaptive   idle backoff only
+  overload   idle backoff plus MML_INGEST_TARGET_RATE at --target-pct of the fixed rate
+Distance is shift_metrics distance from the stored rows, relative to the full 15 s track.
+Run from backend/:
+    python -m benchmarks.bench_ping_interval --riders 200 --hours 4
+"""
+import argparse
+import heapq
+import random
+from datetime import datetime, timedelta
+import ping_filter, ping_interval, shift_metrics
+from benchmarks.bench_tracks import INTERVAL_S, delivery_track
+from benchmarks.seed import EPOCH
+
+UNIX_EPOCH = datetime(1970, 1, 1)
+
+
+def distance_km(points):
+    seconds = [(t - UNIX_EPOCH).total_seconds() for t, _, _ in points]
+    return shift_metrics.compute(seconds, [p[1] for p in points], [p[2] for p in points])["distance_m"] / 1000
+
+
+def simulate(tracks, duration_s, scheduler, rng):
+    """Returns (requests, stored rows per rider, recommended intervals)."""
+    stationary = ping_filter.StationaryFilter(enabled=True)
+    queue = [(rng.uniform(0, INTERVAL_S), rider) for rider in range(len(tracks))]
+    heapq.heapify(queue)
+    stored = [[] for _ in tracks]
+    intervals = []
+    while queue:
+        offset, rider = heapq.heappop(queue)
+        if offset >= duration_s:
+            continue
+        now = EPOCH + timedelta(seconds=offset)
+        _, lat, lng = tracks[rider][min(int(offset // INTERVAL_S), len(tracks[rider]) - 1)]
+        row = {"shift_id": rider, "timestamp": now, "latitude": lat, "longitude": lng}
+        stored[rider] += stationary.admit(rider, row)
+        interval = scheduler.next_interval(stationary.stationary_seconds(rider), now) if scheduler else INTERVAL_S
+        intervals.append(interval)
+        heapq.heappush(queue, (offset + interval, rider))
+    for rider in range(len(tracks)):
+        stored[rider] += stationary.shift_ended(rider)
+    return len(intervals), stored, intervals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--riders", type=int, default=200)
+    parser.add_argument("--hours", type=float, default=4)
+    parser.add_argument("--target-pct", type=float, default=50, help="Overload run: target rate as %% of the fixed-timer rate")
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    duration_s = args.hours * 3600
+    tracks = [delivery_track(rng, EPOCH)[:int(duration_s // INTERVAL_S)] for _ in range(args.riders)]
+    full_km = sum(distance_km(track) for track in tracks)
+    fixed_rate = args.riders / INTERVAL_S
+
+    runs = [
+        ("fixed 15 s", None),
+        ("adaptive", ping_interval.PingScheduler()),
+        (f"overload {args.target_pct:.0f}%", ping_interval.PingScheduler(target_rate=fixed_rate * args.target_pct / 100)),
+    ]
+    print(f"{args.riders} riders, {args.hours:g} h simulated, full-track distance {full_km:.0f} km")
+    print(f"{'run':<14} | {'requests':>8} | {'req/s':>6} | {'vs fixed':>8} | {'avg int s':>9} | {'rows':>7} | {'distance':>8}")
+    baseline = None
+    for name, scheduler in runs:
+        requests, stored, intervals = simulate(tracks, duration_s, scheduler, random.Random(5))
+        baseline = baseline or requests
+        rows = sum(len(rider) for rider in stored)
+        km = sum(distance_km([(r["timestamp"], r["latitude"], r["longitude"]) for r in rider]) for rider in stored)
+        print(f"{name:<14} | {requests:>8} | {requests / duration_s:>6.1f} | {requests / baseline * 100 - 100:>+7.1f}% | "
+              f"{sum(intervals) / len(intervals):>9.1f} | {rows:>7} | {km / full_km * 100 - 100:>+7.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Cost of the request metrics middleware per request, and of rendering /metrics.
+
+Calls a minimal ASGI app directly (no server, no HTTP parsing) with and without
+metrics.MetricsMiddleware in front, so the difference is the middleware alone.
+Compare with /location itself (a few ms in benchmarks.suite). Run from backend/:
+    python -m benchmarks.bench_request_metrics --requests 200000
+"""
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+import metrics
+
+ROUTES = [SimpleNamespace(path=f"/admin/route{n}/{{item_id}}") for n in range(60)] + [SimpleNamespace(path="/location")]
+
+
+async def endpoint(scope, receive, send):
+    scope["route"] = ROUTES[-1]  # What the router does on a match
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b'{"status":"recorded"}'})
+
+
+async def drive(app, requests):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app({"type": "http", "method": "POST", "path": "/location"}, receive, send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+
+    request_metrics = metrics.RequestMetrics()
+    bare = asyncio.run(drive(endpoint, args.requests))
+    wrapped = asyncio.run(drive(metrics.MetricsMiddleware(endpoint, request_metrics), args.requests))
+    print(f"bare ASGI app          {bare:>7.2f} us/request")
+    print(f"with MetricsMiddleware {wrapped:>7.2f} us/request  (+{wrapped - bare:.2f} us)")
+
+    for route in ROUTES:  # A realistic number of series
+        for status in (200, 403, 404):
+            request_metrics.started()
+            request_metrics.finished("GET", route.path, status, 0.004)
+    started = time.perf_counter()
+    text = "\n".join(request_metrics.render())
+    print(f"render /metrics        {(time.perf_counter() - started) * 1000:>7.2f} ms for {len(ROUTES)} routes "
+          f"({len(text.splitlines())} lines)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Proximity query latency over the live position store as the active fleet grows.
+
+Fills a PositionStore with riders spread over the city and times nearest-k,
+radius and bounding-box queries through the grid index against a full scan of
+every position (what a query over snapshot() would cost). Run from backend/:
+    python -m benchmarks.bench_spatial --riders 70 1000 10000
+"""
+import argparse
+import heapq
+import random
+import time
+from datetime import datetime
+from types import SimpleNamespace
+import geo_index, live_map
+from benchmarks.seed import CENTER
+
+
+def fill(riders, spread, rng):
+    store = live_map.PositionStore()
+    now = datetime.utcnow()
+    for user_id in range(1, riders + 1):
+        user = SimpleNamespace(id=user_id, full_name=f"Worker {user_id}", worker_number=f"W{user_id:05d}", vehicle_type="moto")
+        store.update_position(user, user_id, CENTER[0] + rng.uniform(-spread, spread),
+                              CENTER[1] + rng.uniform(-spread, spread), now)
+    return store
+
+
+def scan_nearest(snapshot, lat, lng, k):
+    return heapq.nsmallest(k, snapshot, key=lambda w: geo_index.haversine_m(lat, lng, w["lat"], w["lng"]))
+
+
+def timed(fn, points):
+    samples, results = [], 0
+    for lat, lng in points:
+        started = time.perf_counter()
+        results += len(fn(lat, lng))
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1e6
+    return pick(0.5), pick(0.99), results / len(points)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--riders", type=int, nargs="+", default=[70, 250, 1000, 2500, 10000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--spread", type=float, default=0.1, help="Degrees around the city centre (0.1 ~ 11 km)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--radius", type=float, default=1000, help="Metres for the radius query")
+    parser.add_argument("--box", type=float, default=0.01, help="Bounding box side in degrees")
+    args = parser.parse_args()
+
+    print(f"{args.queries} queries per size, riders within +/-{args.spread} deg, grid cell {geo_index.CELL_DEGREES} deg; "
+          f"times in microseconds (p50 / p99), [avg results]")
+    print(f"{'riders':>7} | {'nearest k=' + str(args.k):>22} | {'scan nearest':>14} | "
+          f"{f'within {args.radius:.0f} m':>22} | {'bbox':>22} | {'update':>7}")
+    for riders in args.riders:
+        rng = random.Random(riders)
+        store = fill(riders, args.spread, rng)
+        points = [(CENTER[0] + rng.uniform(-args.spread, args.spread), CENTER[1] + rng.uniform(-args.spread, args.spread))
+                  for _ in range(args.queries)]
+        half = args.box / 2
+
+        near = timed(lambda lat, lng: store.nearest(lat, lng, args.k), points)
+        scan = timed(lambda lat, lng: scan_nearest(store.snapshot(), lat, lng, args.k), points[:max(50, args.queries // 20)])
+        within = timed(lambda lat, lng: store.within(lat, lng, args.radius), points)
+        box = timed(lambda lat, lng: store.in_bbox(lat - half, lng - half, lat + half, lng + half), points)
+
+        user = SimpleNamespace(id=1, full_name="Worker 1", worker_number="W00001", vehicle_type="moto")
+        started = time.perf_counter()
+        for lat, lng in points:
+            store.update_position(user, 1, lat, lng, datetime.utcnow())
+        update = (time.perf_counter() - started) / len(points) * 1e6
+
+        fmt = lambda r: f"{r[0]:>6.1f} / {r[1]:>6.1f} [{r[2]:>4.1f}]"
+        print(f"{riders:>7} | {fmt(near):>22} | {scan[0]:>6.0f} / {scan[1]:>5.0f} | {fmt(within):>22} | {fmt(box):>22} | {update:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Stationary-ping suppression: rows saved vs how much the stored tracks change.
+
+Runs realistic delivery shifts (bench_tracks.delivery_track: 15 s pings, 1-6 minute
+stops, GPS noise) through ping_filter.StationaryFilter for several radii and reports
+the share of pings stored, the furthest a dropped fix lies from the stored track and
+the change in shift_metrics distance / moving / idle time. Run from backend/:
+    python -m benchmarks.bench_stationary --shifts 50 --radius 10 20 30
+"""
+import argparse
+import random
+import time
+from datetime import datetime
+import numpy as np
+import geo_index, ping_filter, shift_metrics
+from benchmarks.bench_tracks import delivery_track
+from benchmarks.seed import EPOCH
+
+UNIX_EPOCH = datetime(1970, 1, 1)
+
+
+def metrics(points):
+    seconds = [(t - UNIX_EPOCH).total_seconds() for t, _, _ in points]
+    return shift_metrics.compute(seconds, [lat for _, lat, _ in points], [lng for _, _, lng in points])
+
+
+def max_deviation_m(points, kept):
+    """Furthest a dropped fix lies from the stored fix just before it."""
+    stored = {t for t, _, _ in kept}
+    worst, anchor = 0.0, points[0]
+    for point in points:
+        if point[0] in stored:
+            anchor = point
+        else:
+            worst = max(worst, geo_index.haversine_m(anchor[1], anchor[2], point[1], point[2]))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shifts", type=int, default=50)
+    parser.add_argument("--radius", type=float, nargs="+", default=[10, 20, 30], help="Metres")
+    parser.add_argument("--max-seconds", type=float, default=ping_filter.STATIONARY_MAX_SECONDS)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    shifts = [delivery_track(rng, EPOCH) for _ in range(args.shifts)]
+    pings = sum(len(points) for points in shifts)
+    full = [metrics(points) for points in shifts]
+
+    print(f"{args.shifts} shifts, {pings} pings, heartbeat every {args.max_seconds:.0f} s")
+    print(f"{'radius m':>8} | {'stored':>7} | {'us/ping':>7} | {'max dev m':>9} | {'distance':>8} | {'moving':>7} | {'idle':>7}")
+    for radius in args.radius:
+        stationary = ping_filter.StationaryFilter(enabled=True, radius_m=radius, max_seconds=args.max_seconds)
+        thinned, deviation, seconds = [], 0.0, 0.0
+        for shift_id, points in enumerate(shifts, 1):
+            rows = [{"shift_id": shift_id, "timestamp": t, "latitude": lat, "longitude": lng} for t, lat, lng in points]
+            started = time.perf_counter()
+            kept = [row for fix in rows for row in stationary.admit(1, fix)] + stationary.shift_ended(1)
+            seconds += time.perf_counter() - started
+            kept = [(row["timestamp"], row["latitude"], row["longitude"]) for row in kept]
+            thinned.append(metrics(kept))
+            deviation = max(deviation, max_deviation_m(points, kept))
+
+        change = lambda field: np.sum([m[field] for m in thinned]) / np.sum([m[field] for m in full]) * 100 - 100
+        stats = stationary.stats()
+        print(f"{radius:>8.0f} | {100 - stats['suppressed_pct']:>6.1f}% | {seconds / pings * 1e6:>7.1f} | {deviation:>9.1f} | "
+              f"{change('distance_m'):>+7.1f}% | {change('moving_seconds'):>+6.1f}% | {change('idle_seconds'):>+6.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Storage and decode throughput of compacted GPS tracks vs `locations` rows.
+
+Each shift is a realistic 10-hour delivery shift pinged every 15 s (2400 fixes):
+stops, city speeds and a few metres of GPS noise. Run from backend/:
+    python -m benchmarks.bench_tracks --shifts 200
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+import models, migrations, track_codec, tracks
+from benchmarks.seed import CENTER, EPOCH
+
+SHIFT_HOURS = 10
+INTERVAL_S = 15
+METRES_PER_DEGREE = 111_320
+
+
+def delivery_track(rng, start):
+    """(timestamp, lat, lng) fixes of one shift: rides at 15-45 km/h between 1-6 minute stops."""
+    lat = CENTER[0] + rng.uniform(-0.03, 0.03)
+    lng = CENTER[1] + rng.uniform(-0.03, 0.03)
+    heading = rng.uniform(0, 2 * math.pi)
+    stopped_for = 0
+    points = []
+    for i in range(SHIFT_HOURS * 3600 // INTERVAL_S):
+        if stopped_for:
+            stopped_for -= 1
+        else:
+            if rng.random() < 0.04:
+                stopped_for = rng.randint(4, 24)
+            heading += rng.gauss(0, 0.4)
+            metres = rng.uniform(15, 45) / 3.6 * INTERVAL_S
+            lat += metres * math.cos(heading) / METRES_PER_DEGREE
+            lng += metres * math.sin(heading) / (METRES_PER_DEGREE * math.cos(math.radians(lat)))
+        noise = 4 / METRES_PER_DEGREE
+        timestamp = start + timedelta(seconds=i * INTERVAL_S + rng.uniform(-1, 1))
+        points.append((timestamp, lat + rng.gauss(0, noise), lng + rng.gauss(0, noise)))
+    return points
+
+
+def table_bytes(conn, table):
+    """Pages used by a table and its indexes (SQLite dbstat)."""
+    return conn.execute(text(
+        "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN "
+        "(SELECT name FROM sqlite_master WHERE tbl_name = :table)"
+    ), {"table": table}).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shifts", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'tracks.db')}")
+    migrations.run_migrations(engine)
+    session_factory = sessionmaker(bind=engine)
+
+    samples = []
+    with engine.begin() as conn:
+        conn.execute(insert(models.User.__table__), [{"id": 1, "email": "rider@bench.local", "full_name": "Rider", "role": "worker"}])
+        for shift_id in range(1, args.shifts + 1):
+            start = EPOCH + timedelta(days=shift_id)
+            points = delivery_track(rng, start)
+            if shift_id <= 3:
+                samples.append(points)
+            conn.execute(insert(models.Shift.__table__), [{
+                "id": shift_id, "user_id": 1, "start_time": start, "end_time": points[-1][0], "status": "completed"
+            }])
+            conn.execute(insert(models.LocationLog.__table__), [
+                {"shift_id": shift_id, "timestamp": t, "latitude": lat, "longitude": lng} for t, lat, lng in points
+            ])
+    point_count = args.shifts * len(samples[0])
+
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+        raw_bytes = table_bytes(conn, "locations")
+
+    db = session_factory()
+    raw_read = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        tracks.track_points(db, 2)
+        raw_read.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    tracks.compact_closed_shifts(db)
+    compact_s = time.perf_counter() - started
+
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+        compact_bytes = table_bytes(conn, "shift_tracks")
+        leftover_bytes = table_bytes(conn, "locations")
+
+    track_read = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        tracks.track_points(db, 2)
+        track_read.append(time.perf_counter() - started)
+
+    blob = db.get(models.ShiftTrack, 2).encoded
+    decode = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        track_codec.decode(blob)
+        decode.append(time.perf_counter() - started)
+    db.close()
+
+    worst_m = worst_ms = 0
+    for points in samples:
+        for (t, lat, lng), (t2, lat2, lng2) in zip(points, track_codec.decode(track_codec.encode(points))):
+            worst_ms = max(worst_ms, abs((t2 - t).total_seconds()) * 1000)
+            worst_m = max(worst_m, abs(lat2 - lat) * METRES_PER_DEGREE, abs(lng2 - lng) * METRES_PER_DEGREE)
+
+    decode_s = statistics.median(decode)
+    print(f"{args.shifts} shifts x {len(samples[0])} fixes ({SHIFT_HOURS} h @ {INTERVAL_S} s) = {point_count} points")
+    print(f"locations rows + indexes : {raw_bytes / 1024 / 1024:8.2f} MB  ({raw_bytes / point_count:5.1f} B/point)")
+    print(f"shift_tracks blobs       : {compact_bytes / 1024 / 1024:8.2f} MB  ({compact_bytes / point_count:5.1f} B/point)"
+          f"  -> {raw_bytes / compact_bytes:.1f}x smaller (locations left: {leftover_bytes} B)")
+    print(f"compaction               : {compact_s * 1000 / args.shifts:8.2f} ms/shift")
+    print(f"decode one shift         : {decode_s * 1000:8.2f} ms  ({len(samples[0]) / decode_s / 1e6:.2f} M points/s)")
+    print(f"read one track (API)     : raw rows {statistics.median(raw_read) * 1000:.2f} ms, compacted {statistics.median(track_read) * 1000:.2f} ms")
+    print(f"round-trip error         : {worst_m * 100:.2f} cm, {worst_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Ping burst vs admin panel latency, sync endpoints vs the async path (MML_ASYNC_DB=1).
+
+Starts the API with uvicorn (one worker, as deployed) on a seeded SQLite copy,
+then `--concurrency` clients post /location as fast as they can while an admin
+client polls /admin/workers-map. `--logins N` adds N simultaneous /token calls at
+the start (the 07:00 login storm). Run from backend/:
+    python -m benchmarks.load_test --concurrency 200 --duration 15
+    python -m benchmarks.load_test --concurrency 20 --logins 60 --hash-workers 0 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from sqlalchemy import create_engine, select
+import migrations, models, security
+from benchmarks.seed import CENTER, WORKER_PASSWORD, seed
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def token(email):
+    return security.create_access_token(data={"sub": email}, expires_delta=security.timedelta(hours=1))
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": 0, "p95": 0, "p99": 0, "max": 0}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1] * 1000}
+
+
+async def wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(f"{base_url}/openapi.json")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("API did not start")
+
+
+async def load(base_url, riders, concurrency, duration, admin_interval, logins=0):
+    stop_at = time.monotonic() + duration
+    pings, admin, errors, login_times, login_errors = [], [], [], [], []
+    admin_headers = {"Authorization": f"Bearer {token('admin@fichaje.com')}"}
+    rider_headers = [{"Authorization": f"Bearer {token(email)}"} for email in riders]
+    rng = random.Random(1)
+
+    async def rider(client):
+        while time.monotonic() < stop_at:
+            headers = rng.choice(rider_headers)
+            body = {"latitude": CENTER[0] + rng.uniform(-0.05, 0.05), "longitude": CENTER[1] + rng.uniform(-0.05, 0.05)}
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{base_url}/location", json=body, headers=headers)
+            except httpx.HTTPError as e:
+                errors.append(type(e).__name__)
+                continue
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+            pings.append(time.perf_counter() - started)
+
+    async def admin_panel(client):
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                response = await client.get(f"{base_url}/admin/workers-map", headers=admin_headers)
+                response.raise_for_status()
+                admin.append(time.perf_counter() - started)
+            except httpx.HTTPError as e:
+                errors.append(f"admin {type(e).__name__}")
+            await asyncio.sleep(admin_interval)
+
+    async def login(client, email):
+        started = time.perf_counter()
+        try:
+            response = await client.post(f"{base_url}/token", data={"username": email, "password": WORKER_PASSWORD})
+        except httpx.HTTPError as e:
+            login_errors.append(type(e).__name__)
+            return
+        if response.status_code != 200:
+            login_errors.append(response.status_code)
+            return
+        login_times.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency + logins + 10, max_keepalive_connections=concurrency + logins + 10)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        storm = [login(client, riders[i % len(riders)]) for i in range(logins)]
+        await asyncio.gather(admin_panel(client), *storm, *[rider(client) for _ in range(concurrency)])
+    return pings, admin, errors, login_times, login_errors
+
+
+def run_mode(mode, args, hash_workers):
+    workdir = tempfile.mkdtemp()
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'fichaje.db')}")
+    migrations.run_migrations(engine)
+    seed(engine, users=args.riders, days=1, locations=0)  # Riders working today are on an open shift
+    with engine.connect() as conn:
+        riders = conn.execute(select(models.User.email).join(models.Shift, models.Shift.user_id == models.User.id).where(
+            models.Shift.status == "active"
+        )).scalars().all()
+    engine.dispose()
+
+    port = free_port()
+    env = dict(os.environ, MML_ASYNC_DB="1" if mode == "async" else "0", PYTHONPATH=BACKEND_DIR,
+               MML_WRITE_BEHIND="1" if args.write_behind else "0", MML_HASH_WORKERS=str(hash_workers))
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            asyncio.run(wait_ready(base_url))
+            result = asyncio.run(load(base_url, riders, args.concurrency, args.duration, args.admin_interval, args.logins))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()  # Requests still queued behind the server
+                server.wait()
+    with open(log_path) as log:
+        server_errors = log.read().count("Exception in ASGI application")
+    return result + (server_errors,)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--riders", type=int, default=70)
+    parser.add_argument("--concurrency", type=int, default=200, help="Clients posting pings at the same time")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds per mode")
+    parser.add_argument("--admin-interval", type=float, default=0.25, help="Seconds between admin map polls")
+    parser.add_argument("--modes", nargs="+", default=["sync", "async"], choices=["sync", "async"])
+    parser.add_argument("--write-behind", action="store_true", help="Run the server with MML_WRITE_BEHIND=1")
+    parser.add_argument("--logins", type=int, default=0, help="Simultaneous logins at the start of each run")
+    parser.add_argument("--hash-workers", type=int, nargs="+", default=[2], help="MML_HASH_WORKERS values to compare")
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} concurrent ping clients, {args.riders} riders, {args.duration:.0f} s per mode"
+          + (", write-behind ingest" if args.write_behind else "") + (f", {args.logins} logins" if args.logins else ""))
+    print(f"{'mode':<12} | {'pings/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} | "
+          f"{'map p50':>8} {'map p95':>8} {'map p99':>8} {'map max':>8} | errors (server exceptions)")
+    for mode in args.modes:
+        for hash_workers in args.hash_workers:
+            pings, admin, errors, login_times, login_errors, server_errors = run_mode(mode, args, hash_workers)
+            ping, panel = percentiles(pings), percentiles(admin)
+            name = f"{mode} h={hash_workers}" if len(args.hash_workers) > 1 else mode
+            print(f"{name:<12} | {len(pings) / args.duration:>8.0f} {ping['p50']:>8.1f} {ping['p95']:>8.1f} {ping['p99']:>8.1f} | "
+                  f"{panel['p50']:>8.1f} {panel['p95']:>8.1f} {panel['p99']:>8.1f} {panel['max']:>8.1f} | {len(errors)}"
+                  + (f" (mostly {statistics.mode(errors)})" if errors else "") + f" ({server_errors})")
+            if args.logins:
+                login = percentiles(login_times)
+                print(f"{'':<12} | logins ok {len(login_times)}, p50 {login['p50']:.0f} ms, max {login['max']:.0f} ms, "
+                      f"failed {len(login_errors)}" + (f" (mostly {statistics.mode(login_errors)})" if login_errors else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Deterministic synthetic datasets for the benchmarks.
+
+Run from backend/:
+    python -m benchmarks.seed --db /tmp/mml_bench.db --users 70 --days 365 --locations 2000000
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert
+import models, security, migrations
+
+EPOCH = datetime(2025, 1, 6)  # A Monday
+CENTER = (42.5987, -5.5671)   # León, same default as the admin panel map
+WORKER_PASSWORD = "worker123"
+CHUNK = 20000
+
+
+def _insert(conn, table, rows):
+    for start in range(0, len(rows), CHUNK):
+        conn.execute(insert(table), rows[start:start + CHUNK])
+
+
+def seed(engine, users=70, days=30, locations=100000, seed=42, active_shifts=True):
+    """Fills an empty database. Same arguments always produce the same rows.
+
+    Workers are worker{n}@bench.local / worker123 (plus the usual admin user),
+    each working most days with some shifts crossing midnight. `locations` pings
+    are spread evenly over the completed and active shifts.
+    """
+    rng = random.Random(seed)
+    password_hash = security.get_password_hash(WORKER_PASSWORD)
+
+    user_rows = [{
+        "id": 1, "email": "admin@fichaje.com", "hashed_password": security.get_password_hash("admin123"),
+        "full_name": "Admin Antonio", "role": "admin", "worker_number": 999, "vehicle_type": "car", "is_active": True
+    }]
+    for n in range(1, users + 1):
+        user_rows.append({
+            "id": n + 1, "email": f"worker{n}@bench.local", "hashed_password": password_hash,
+            "full_name": f"Repartidor {n}", "role": "worker", "worker_number": n,
+            "vehicle_type": rng.choice(["car", "motorcycle", "scooter"]), "is_active": True
+        })
+
+    active_from = EPOCH + timedelta(days=days - 1) if active_shifts else None
+    spans = []
+    shift_count = 0
+    location_count = 0
+
+    with engine.begin() as conn:
+        _insert(conn, models.User.__table__, user_rows)
+
+        # Shifts and pings are generated and written in chunks to keep memory flat at millions of rows
+        shift_rows = []
+        for day in range(days):
+            for user in user_rows[1:]:
+                if rng.random() > 0.85:
+                    continue
+                if rng.random() < 0.05:
+                    start = EPOCH + timedelta(days=day, hours=rng.uniform(19, 22))  # Night shift, crosses midnight
+                else:
+                    start = EPOCH + timedelta(days=day, hours=rng.uniform(7, 10))
+                end = start + timedelta(hours=rng.uniform(4, 10))
+                incident = "retraso" if rng.random() < 0.05 else "normal"
+                if active_from is not None and start >= active_from:
+                    end = None  # Each worker's shift on the last day is still open
+                shift_count += 1
+                shift_rows.append({
+                    "id": shift_count, "user_id": user["id"], "start_time": start, "end_time": end,
+                    "status": "active" if end is None else "completed", "total_pause_time_minutes": 0,
+                    "incident_type": incident
+                })
+                if locations:
+                    spans.append((shift_count, start, end))
+            if len(shift_rows) >= CHUNK:
+                _insert(conn, models.Shift.__table__, shift_rows)
+                shift_rows = []
+        _insert(conn, models.Shift.__table__, shift_rows)
+
+        per_shift = locations // shift_count if shift_count else 0
+        extra = locations - per_shift * shift_count
+        location_rows = []
+        for index, (shift_id, start, end) in enumerate(spans):
+            count = per_shift + (1 if index < extra else 0)
+            if not count:
+                continue
+            end = end or start + timedelta(hours=4)
+            step = (end - start) / count
+            lat = CENTER[0] + rng.uniform(-0.05, 0.05)
+            lng = CENTER[1] + rng.uniform(-0.05, 0.05)
+            for i in range(count):
+                lat += rng.uniform(-0.0005, 0.0005)
+                lng += rng.uniform(-0.0005, 0.0005)
+                location_count += 1
+                location_rows.append({
+                    "id": location_count, "shift_id": shift_id, "latitude": lat, "longitude": lng,
+                    "timestamp": start + step * i
+                })
+            if len(location_rows) >= CHUNK:
+                _insert(conn, models.LocationLog.__table__, location_rows)
+                location_rows = []
+        _insert(conn, models.LocationLog.__table__, location_rows)
+
+    return {"users": len(user_rows), "shifts": shift_count, "locations": location_count}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed a benchmark database")
+    parser.add_argument("--db", required=True, help="SQLite file to create")
+    parser.add_argument("--users", type=int, default=70)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--locations", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_engine(f"sqlite:///{args.db}")
+    migrations.run_migrations(engine)
+    print(seed(engine, args.users, args.days, args.locations, args.seed))
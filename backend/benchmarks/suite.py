@@ -0,0 +1,266 @@
+"""Endpoint benchmark suite: seeded datasets at several scales, JSON results, regression check.
+
+For each scale a deterministic dataset is seeded once (benchmarks.seed, cached under
+--data-dir) and copied to a scratch file. A child process runs the API in-process on
+that copy, calls every endpoint through the FastAPI test client (one warm-up round,
+then --repeat timed rounds) and counts the SQL statements each call issues. Results
+go to a JSON file; --baseline compares against an earlier one and exits non-zero
+when an endpoint got slower than --threshold (and by more than --min-delta-ms) or
+issues more queries. A slowdown must show in both the median and the fastest call, so
+one noisy burst on a shared machine does not fail the run. Run from backend/:
+    python -m benchmarks.suite --scales small medium --output before.json
+    python -m benchmarks.suite --scales small medium --baseline before.json --output after.json
+    python -m benchmarks.suite --results after.json --baseline before.json    # compare two saved runs
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import migrations, rollups, shift_metrics
+from benchmarks.seed import CENTER, EPOCH, seed
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_VERSION = 2  # Bumped when the dataset build changes, so cached files are rebuilt (2: shift metrics cached)
+
+SCALES = {
+    "small": {"users": 20, "days": 14, "locations": 50_000},
+    "medium": {"users": 70, "days": 90, "locations": 500_000},
+    "large": {"users": 200, "days": 365, "locations": 3_000_000},
+}
+
+
+def endpoints(scale, track_shift_id):
+    """(name, method, path, query params, caller) for every endpoint timed."""
+    last_day = EPOCH + timedelta(days=SCALES[scale]["days"] - 1)
+    week = {"start_date": (last_day - timedelta(days=6)).date().isoformat(), "end_date": last_day.date().isoformat()}
+    month = {"start_date": last_day.replace(day=1).date().isoformat(), "end_date": last_day.date().isoformat()}
+    return [
+        ("GET /admin/workers-map", "GET", "/admin/workers-map", {}, "admin"),
+        ("GET /admin/workers-map/nearest", "GET", "/admin/workers-map/nearest", {"lat": CENTER[0], "lng": CENTER[1], "k": 5}, "admin"),
+        ("GET /admin/stats", "GET", "/admin/stats", {}, "admin"),
+        ("GET /admin/alerts/open_shifts", "GET", "/admin/alerts/open_shifts", {}, "admin"),
+        ("GET /admin/shifts (recent 500)", "GET", "/admin/shifts", {"order": "recent", "limit": 500}, "admin"),
+        ("GET /admin/shifts/daily", "GET", f"/admin/shifts/daily/{last_day.date().isoformat()}", {}, "admin"),
+        ("GET /admin/shifts/monthly", "GET", f"/admin/shifts/monthly/{last_day.year}/{last_day.month}", {}, "admin"),
+        ("GET /admin/shifts/{id}/track", "GET", f"/admin/shifts/{track_shift_id}/track", {}, "admin"),
+        ("GET /admin/reports/hours_summary", "GET", "/admin/reports/hours_summary", {}, "admin"),
+        ("GET /admin/reports/hours_summary (rollup)", "GET", "/admin/reports/hours_summary", {"source": "rollup"}, "admin"),
+        ("GET /admin/reports/monthly", "GET", f"/admin/reports/monthly/{last_day.year}/{last_day.month}", {}, "admin"),
+        ("GET /admin/reports/distance_summary (week)", "GET", "/admin/reports/distance_summary", week, "admin"),
+        ("GET /admin/export/shifts (month)", "GET", "/admin/export/shifts", month, "admin"),
+        ("GET /users/me", "GET", "/users/me", {}, "rider"),
+        ("POST /location", "POST", "/location", {}, "rider"),
+    ]
+
+
+def dataset_path(scale, data_dir, seed_value):
+    """Seeded SQLite file for a scale, built on first use."""
+    params = SCALES[scale]
+    path = os.path.join(data_dir, f"{scale}-{params['users']}u-{params['days']}d-{params['locations']}l-seed{seed_value}-v{DATASET_VERSION}.db")
+    if os.path.exists(path):
+        return path
+    os.makedirs(data_dir, exist_ok=True)
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    print(f"Seeding {scale} dataset ({params})...", flush=True)
+    engine = create_engine(f"sqlite:///{partial}")
+    migrations.run_migrations(engine)
+    seed(engine, seed=seed_value, **params)
+    with sessionmaker(bind=engine)() as db:
+        rollups.rebuild(db)
+        db.commit()
+        shift_metrics.fill_cache(db)  # Steady state: completed shifts are cached when they close
+    engine.dispose()
+    os.replace(partial, path)
+    return path
+
+
+def run_scale(scale, repeat, max_seconds, output):
+    """Child process: DATABASE_URL already points at the scratch copy."""
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event, func, select
+    import database, main, models, security
+
+    statements = []
+    event.listen(database.engine, "before_cursor_execute", lambda *args: statements.append(None))
+
+    with database.SessionLocal() as db:
+        dataset = {
+            "users": db.scalar(select(func.count()).select_from(models.User)),
+            "shifts": db.scalar(select(func.count()).select_from(models.Shift)),
+            "active_shifts": db.scalar(select(func.count()).select_from(models.Shift).where(models.Shift.status == "active")),
+            "locations": db.scalar(select(func.count()).select_from(models.LocationLog)),
+        }
+        riders = db.execute(select(models.User.email).join(models.Shift, models.Shift.user_id == models.User.id).where(
+            models.Shift.status == "active").order_by(models.User.id)).scalars().all()
+        track_shift_id = db.scalar(select(models.LocationLog.shift_id).join(models.Shift, models.Shift.id == models.LocationLog.shift_id).where(
+            models.Shift.status == "completed").order_by(models.LocationLog.shift_id.desc()).limit(1))
+
+    rng = random.Random(1)
+    rider_headers = [{"Authorization": f"Bearer {security.create_access_token(data={'sub': email})}"} for email in riders]
+    results = {}
+    with TestClient(main.app) as client:
+        admin_token = client.post("/token", data={"username": "admin@fichaje.com", "password": "admin123"}).json()["access_token"]
+        headers = {"admin": lambda: {"Authorization": f"Bearer {admin_token}"}, "rider": lambda: rng.choice(rider_headers)}
+
+        def request(method, path, params, caller):
+            body = {"latitude": CENTER[0] + rng.uniform(-0.05, 0.05), "longitude": CENTER[1] + rng.uniform(-0.05, 0.05)} \
+                if method == "POST" else None
+            return client.request(method, path, params=params, json=body, headers=headers[caller]())
+
+        calls = [call for call in endpoints(scale, track_shift_id) if call[4] == "admin" or rider_headers]
+        status = {name: request(*call).status_code for name, *call in calls}  # Warm-up (caches, SQLite pages)
+        timings = {name: [] for name, *_ in calls}
+        queries = {name: [] for name, *_ in calls}
+        # Round-robin, so a noisy stretch on the machine hits every endpoint alike
+        budget = time.perf_counter() + max_seconds
+        for round_number in range(repeat):
+            if round_number >= 3 and time.perf_counter() > budget:
+                break
+            for name, *call in calls:
+                statements.clear()
+                started = time.perf_counter()
+                response = request(*call)
+                timings[name].append((time.perf_counter() - started) * 1000)
+                queries[name].append(len(statements))
+                status[name] = max(status[name], response.status_code)
+
+    for name, samples in timings.items():
+        samples.sort()
+        results[name] = {
+            "status": status[name],
+            "samples": len(samples),
+            "p50_ms": round(statistics.median(samples), 3),
+            "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+            "min_ms": round(samples[0], 3),
+            "mean_ms": round(statistics.fmean(samples), 3),
+            "queries": max(queries[name]),
+        }
+        print(f"  {name:<44} {results[name]['p50_ms']:>9.2f} ms  {results[name]['queries']:>3} queries"
+              + ("" if status[name] == 200 else f"  HTTP {status[name]}"), flush=True)
+
+    with open(output, "w") as f:
+        json.dump({"dataset": dataset, "endpoints": results}, f)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "env": {key: value for key, value in sorted(os.environ.items()) if key.startswith("MML_")},
+        },
+        "scales": {},
+    }
+    for scale in args.scales:
+        source = dataset_path(scale, args.data_dir, args.seed)
+        workdir = tempfile.mkdtemp(prefix=f"mml_suite_{scale}_")
+        try:
+            shutil.copy(source, os.path.join(workdir, "fichaje.db"))
+            output = os.path.join(workdir, "result.json")
+            print(f"{scale}:", flush=True)
+            env = dict(os.environ, PYTHONPATH=BACKEND_DIR, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'fichaje.db')}")
+            subprocess.run([sys.executable, "-m", "benchmarks.suite", "--child", scale, "--child-output", output,
+                            "--repeat", str(args.repeat), "--max-seconds", str(args.max_seconds)],
+                           cwd=workdir, env=env, check=True)
+            with open(output) as f:
+                results["scales"][scale] = json.load(f)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(baseline, current, threshold, min_delta_ms):
+    """Prints the comparison. Returns the number of regressions."""
+    regressions = 0
+    print(f"\nBaseline {baseline['meta'].get('commit')} ({baseline['meta'].get('date')}) -> "
+          f"{current['meta'].get('commit')} ({current['meta'].get('date')}), threshold +{threshold * 100:.0f}%")
+    for scale, result in current["scales"].items():
+        before = baseline["scales"].get(scale)
+        if before is None:
+            print(f"{scale}: not in the baseline")
+            continue
+        if before["dataset"] != result["dataset"]:
+            print(f"{scale}: WARNING datasets differ ({before['dataset']} vs {result['dataset']})")
+        print(f"{scale}:")
+        print(f"  {'endpoint':<44} | {'base ms':>9} | {'now ms':>9} | {'change':>8} | {'queries':>9} |")
+        for name, now in result["endpoints"].items():
+            old = before["endpoints"].get(name)
+            if old is None:
+                print(f"  {name:<44} | {'':>9} | {now['p50_ms']:>9.2f} | {'new':>8} | {now['queries']:>9} |")
+                continue
+            change = now["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0.0
+            slower = change > threshold and now["min_ms"] > old["min_ms"] * (1 + threshold) and \
+                now["p50_ms"] - old["p50_ms"] > min_delta_ms
+            more_queries = now["queries"] > old["queries"]
+            broken = now["status"] != 200 and old["status"] == 200
+            flags = [flag for flag, hit in (("SLOWER", slower), ("MORE QUERIES", more_queries), (f"HTTP {now['status']}", broken)) if hit]
+            regressions += bool(flags)
+            print(f"  {name:<44} | {old['p50_ms']:>9.2f} | {now['p50_ms']:>9.2f} | {change * 100:>+7.1f}% | "
+                  f"{str(old['queries']) + ' -> ' + str(now['queries']):>9} | {' '.join(flags)}")
+    print(f"{regressions} regression(s)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(SCALES))
+    parser.add_argument("--repeat", type=int, default=30, help="Timed rounds over all endpoints")
+    parser.add_argument("--max-seconds", type=float, default=120, help="Stop the rounds of a scale after this long (min 3)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "mml_bench_data"), help="Seeded dataset cache")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--results", help="Compare this saved results JSON instead of running")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Allowed slowdown (0.5 = +50%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Ignore slowdowns smaller than this")
+    parser.add_argument("--child", choices=list(SCALES), help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_scale(args.child, args.repeat, args.max_seconds, args.child_output)
+        return 0
+
+    if args.results:
+        with open(args.results) as f:
+            results = json.load(f)
+    else:
+        results = run_suite(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        return 1 if compare(baseline, results, args.threshold, args.min_delta_ms) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
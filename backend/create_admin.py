@@ -1,9 +1,9 @@
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine
-import models, security
+import models, security, migrations
 
 def create_admin():
-    models.Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
     db = SessionLocal()
     
     # Check if admin exists
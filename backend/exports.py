@@ -0,0 +1,92 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+
+# Streaming CSV / NDJSON exports (payroll, labour inspections).
+# Rows are read through a server-side cursor and written out in ~64 KB chunks,
+# optionally gzip-compressed on the fly, so memory stays flat for any date range.
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+CHUNK_BYTES = 64 * 1024
+YIELD_PER = 2000
+
+
+def parse_range(start_date: str = None, end_date: str = None):
+    """Returns (start, end) with `end` exclusive. A date-only end_date covers that whole day."""
+    start = datetime.fromisoformat(start_date) if start_date else None
+    end = None
+    if end_date:
+        end = datetime.fromisoformat(end_date)
+        if len(end_date) == 10:
+            end += timedelta(days=1)
+    return start, end
+
+
+def filename(prefix: str, fmt: str, compress: bool):
+    return f"{prefix}_{datetime.utcnow():%Y%m%d_%H%M%S}.{fmt}" + (".gz" if compress else "")
+
+
+def _format_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+def _encode_rows(rows, fields, fmt):
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([_format_value(row[name]) for name in fields])
+            if buffer.tell() >= CHUNK_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        lines = []
+        size = 0
+        for row in rows:
+            line = json.dumps(jsonable_encoder({name: row[name] for name in fields})) + "\n"
+            lines.append(line)
+            size += len(line)
+            if size >= CHUNK_BYTES:
+                yield "".join(lines)
+                lines = []
+                size = 0
+        yield "".join(lines)
+
+
+def query_rows(query):
+    return (row._mapping for row in query.yield_per(YIELD_PER))
+
+
+def stream_export(session_factory, build_rows, fields, fmt="csv", compress=False):
+    """Generator for StreamingResponse. Owns its session (the request's is closed before streaming).
+
+    `build_rows(db)` returns an iterable of mappings, e.g. query_rows(query).
+    """
+    db = session_factory()
+    try:
+        rows = build_rows(db)
+        chunks = _encode_rows(rows, fields, fmt)
+        if not compress:
+            for chunk in chunks:
+                if chunk:
+                    yield chunk.encode()
+            return
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode())
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        db.close()
@@ -0,0 +1,130 @@
+import heapq
+import math
+import os
+
+# Uniform lat/lng grid over the latest position of each active worker.
+# Queries only visit the cells around the query point, so their cost follows the
+# number of riders nearby rather than the size of the fleet.
+CELL_DEGREES = float(os.getenv("MML_GRID_CELL_DEG", "0.005"))  # ~550 m north-south
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """Point index keyed by an arbitrary id (the user id in PositionStore). Not thread-safe."""
+
+    def __init__(self, cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._cells = {}
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees)
+
+    def update(self, key, lat, lng):
+        cell = self._cell(lat, lng)
+        previous = self._points.get(key)
+        if previous is not None and previous[2] != cell:
+            self._discard(key, previous[2])
+        self._points[key] = (lat, lng, cell)
+        self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        previous = self._points.pop(key, None)
+        if previous is not None:
+            self._discard(key, previous[2])
+
+    def clear(self):
+        self._cells = {}
+        self._points = {}
+
+    def _discard(self, key, cell):
+        members = self._cells[cell]
+        members.discard(key)
+        if not members:
+            del self._cells[cell]
+
+    def _keys_in_cells(self, rows, cols):
+        for row in rows:
+            for col in cols:
+                members = self._cells.get((row, col))
+                if members:
+                    yield from members
+
+    def bbox(self, min_lat, min_lng, max_lat, max_lng):
+        """Keys inside the box (edges included)."""
+        min_row, min_col = self._cell(min_lat, min_lng)
+        max_row, max_col = self._cell(max_lat, max_lng)
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self._points):
+            candidates = self._points  # Zoomed-out box: a scan is cheaper than visiting empty cells
+        else:
+            candidates = self._keys_in_cells(range(min_row, max_row + 1), range(min_col, max_col + 1))
+        points = self._points
+        return [key for key in candidates
+                if min_lat <= points[key][0] <= max_lat and min_lng <= points[key][1] <= max_lng]
+
+    def within(self, lat, lng, radius_m):
+        """(distance_m, key) pairs within radius_m, nearest first."""
+        lat_span = radius_m / METERS_PER_DEGREE
+        lng_span = lat_span / max(math.cos(math.radians(min(89.0, abs(lat) + lat_span))), 1e-6)
+        found = []
+        for key in self.bbox(lat - lat_span, lng - lng_span, lat + lat_span, lng + lng_span):
+            distance = haversine_m(lat, lng, *self._points[key][:2])
+            if distance <= radius_m:
+                found.append((distance, key))
+        found.sort()
+        return found
+
+    def nearest(self, lat, lng, k, max_distance_m=None):
+        """Up to k (distance_m, key) pairs, nearest first.
+
+        Searches rings of cells outwards from the query cell and stops once the
+        k-th best distance is closer than anything the next ring could hold.
+        """
+        if k <= 0 or not self._points:
+            return []
+        points = self._points
+        row0, col0 = self._cell(lat, lng)
+        cell_m = self.cell_degrees * METERS_PER_DEGREE
+        best = []  # Max-heap of (-distance, key), size <= k
+        seen = 0
+        ring = 0
+        while seen < len(points):
+            if (2 * ring + 1) ** 2 > len(points):
+                # Sparse surroundings: ranking every point is cheaper than walking more empty cells
+                best = [(-haversine_m(lat, lng, *point[:2]), key) for key, point in points.items()]
+                best = heapq.nlargest(k, best)
+                break
+            if ring == 0:
+                keys = self._keys_in_cells((row0,), (col0,))
+            else:
+                rows = range(row0 - ring, row0 + ring + 1)
+                keys = [*self._keys_in_cells((row0 - ring, row0 + ring), range(col0 - ring, col0 + ring + 1)),
+                        *self._keys_in_cells(rows[1:-1], (col0 - ring, col0 + ring))]
+            for key in keys:
+                seen += 1
+                item = (-haversine_m(lat, lng, *points[key][:2]), key)
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+            # Anything outside rings 0..ring is at least `ring` whole cells away
+            reach = ring * cell_m * min(1.0, math.cos(math.radians(min(89.0, abs(lat) + (ring + 1) * self.cell_degrees))))
+            if max_distance_m is not None and reach > max_distance_m:
+                break
+            if len(best) == k and -best[0][0] <= reach:
+                break
+            ring += 1
+        found = sorted((-distance, key) for distance, key in best)
+        if max_distance_m is not None:
+            found = [pair for pair in found if pair[0] <= max_distance_m]
+        return found
@@ -0,0 +1,343 @@
+import math
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import archive
+import database
+import exports
+import geo_index
+import models
+import tracks
+
+# Geofence evaluation: enter/exit events for depots, restaurants and restricted zones.
+#
+# The active fences are compiled into NumPy edge arrays (polygons) and centre/radius
+# (circles) with a grid over their bounding boxes, so a ping is only tested against
+# the fences around it. Whole tracks are tested in one pass: points are bucketed by
+# grid cell and each candidate fence runs a vectorized points x edges crossing test.
+SHAPES = ("polygon", "circle")
+CATEGORIES = ("depot", "restaurant", "restricted")
+CELL_DEGREES = float(os.getenv("MML_GEOFENCE_CELL_DEG", "0.01"))
+MAX_INDEXED_CELLS = 2500  # Fences covering more grid cells are tested against every point
+BLOCK_ELEMENTS = 1 << 20  # Points x edges per vectorized block (bounds temporary memory)
+
+
+def company_id(db):
+    """The deployment's company: the single company_settings row (added to the session if missing).
+
+    Users and shifts carry no company yet, so every worker is checked against this company's fences.
+    """
+    settings = db.query(models.CompanySettings).order_by(models.CompanySettings.id).first()
+    if settings is None:
+        settings = models.CompanySettings()
+        db.add(settings)
+        db.flush()
+    return settings.id
+
+
+def _valid_point(lat, lng):
+    return -90 <= lat <= 90 and -180 <= lng <= 180
+
+
+def validate(shape: str, points=None, center_lat=None, center_lng=None, radius_m=None):
+    """Why a fence definition is invalid, or None."""
+    if shape not in SHAPES:
+        return "shape must be 'polygon' or 'circle'"
+    if shape == "polygon":
+        if not points or len(points) < 3:
+            return "A polygon needs at least 3 points"
+        if any(len(point) != 2 or not _valid_point(*point) for point in points):
+            return "Polygon points must be valid [lat, lng] pairs"
+        return None
+    if center_lat is None or center_lng is None or not _valid_point(center_lat, center_lng):
+        return "A circle needs a valid center_lat and center_lng"
+    if not radius_m or radius_m <= 0:
+        return "radius_m must be positive"
+    return None
+
+
+def _distance_m(lats, lngs, lat, lng):
+    phi = np.radians(lats)
+    a = np.sin((math.radians(lat) - phi) / 2) ** 2 + \
+        np.cos(phi) * math.cos(math.radians(lat)) * np.sin(np.radians(lng - lngs) / 2) ** 2
+    return 2 * geo_index.EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _in_polygon(lats, lngs, lat1, lng1, lat2, lng2):
+    """Even-odd crossing test of every point against every edge, in blocks."""
+    inside = np.empty(len(lats), dtype=bool)
+    step = max(1, BLOCK_ELEMENTS // len(lat1))
+    with np.errstate(divide="ignore", invalid="ignore"):  # Horizontal edges never straddle, their NaNs are masked
+        for start in range(0, len(lats), step):
+            lat = lats[start:start + step, None]
+            lng = lngs[start:start + step, None]
+            straddles = (lat1 > lat) != (lat2 > lat)
+            crossing_lng = lng1 + (lat - lat1) * (lng2 - lng1) / (lat2 - lat1)
+            inside[start:start + step] = np.count_nonzero(straddles & (lng < crossing_lng), axis=1) % 2 == 1
+    return inside
+
+
+class CompiledFences:
+    """Active fences as NumPy arrays plus a grid index over their bounding boxes. Read-only once built."""
+
+    def __init__(self, fences=(), cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.ids = np.array([fence.id for fence in fences], dtype=np.int64)
+        self._id_list = self.ids.tolist()
+        self.company_of = {fence.id: fence.company_id for fence in fences}
+        self._shapes = []
+        self._bounds = []  # (min_lat, min_lng, max_lat, max_lng)
+        for fence in fences:
+            if fence.shape == "circle":
+                lat_span = fence.radius_m / geo_index.METERS_PER_DEGREE
+                lng_span = lat_span / max(math.cos(math.radians(min(89.0, abs(fence.center_lat) + lat_span))), 1e-6)
+                self._shapes.append(("circle", fence.center_lat, fence.center_lng, fence.radius_m))
+                self._bounds.append((fence.center_lat - lat_span, fence.center_lng - lng_span,
+                                     fence.center_lat + lat_span, fence.center_lng + lng_span))
+            else:
+                vertices = np.asarray(fence.points, dtype=float)
+                following = np.roll(vertices, -1, axis=0)
+                self._shapes.append(("polygon", vertices[:, 0], vertices[:, 1], following[:, 0], following[:, 1]))
+                self._bounds.append((*vertices.min(axis=0).tolist(), *vertices.max(axis=0).tolist()))
+
+        self._cells = {}
+        self._wide = []
+        for index, (min_lat, min_lng, max_lat, max_lng) in enumerate(self._bounds):
+            (min_row, min_col), (max_row, max_col) = self._cell(min_lat, min_lng), self._cell(max_lat, max_lng)
+            if (max_row - min_row + 1) * (max_col - min_col + 1) > MAX_INDEXED_CELLS:
+                self._wide.append(index)
+                continue
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    self._cells.setdefault((row, col), []).append(index)
+
+    def __len__(self):
+        return len(self._id_list)
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees)
+
+    def _test(self, index, lats, lngs):
+        shape = self._shapes[index]
+        if shape[0] == "circle":
+            return _distance_m(lats, lngs, shape[1], shape[2]) <= shape[3]
+        return _in_polygon(lats, lngs, *shape[1:])
+
+    def containing(self, lat, lng):
+        """Ids of the fences containing one point."""
+        found = []
+        point_lat = point_lng = None
+        for index in self._cells.get(self._cell(lat, lng), []) + self._wide:
+            min_lat, min_lng, max_lat, max_lng = self._bounds[index]
+            if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+                continue
+            if point_lat is None:
+                point_lat, point_lng = np.array([lat]), np.array([lng])
+            if self._test(index, point_lat, point_lng)[0]:
+                found.append(self._id_list[index])
+        return found
+
+    def membership(self, lats, lngs):
+        """Boolean matrix (points x fences): whether each point is inside each fence."""
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        result = np.zeros((len(lats), len(self)), dtype=bool)
+        if not len(lats) or not len(self):
+            return result
+
+        # Only fences indexed under a cell the points fall in can contain any of them
+        cells = np.stack([np.floor(lats / self.cell_degrees), np.floor(lngs / self.cell_degrees)], axis=1).astype(np.int64)
+        candidates = set(self._wide)
+        for row, col in np.unique(cells, axis=0).tolist():
+            candidates.update(self._cells.get((row, col), ()))
+
+        for index in sorted(candidates):
+            min_lat, min_lng, max_lat, max_lng = self._bounds[index]
+            hits = np.flatnonzero((lats >= min_lat) & (lats <= max_lat) & (lngs >= min_lng) & (lngs <= max_lng))
+            if len(hits):
+                result[hits, index] = self._test(index, lats[hits], lngs[hits])
+        return result
+
+
+def _event(fences, geofence_id, user_id, shift_id, entered, timestamp, lat, lng):
+    return {
+        "geofence_id": geofence_id, "company_id": fences.company_of[geofence_id], "user_id": user_id, "shift_id": shift_id, "event": "enter" if entered else "exit",
+        "timestamp": timestamp, "latitude": lat, "longitude": lng
+    }
+
+
+def track_events(fences: CompiledFences, user_id, shift_id, points, inside=frozenset()):
+    """Enter/exit events along (timestamp, lat, lng) points in time order, starting inside `inside`.
+
+    Returns (events, fence ids containing the last point).
+    """
+    if not points or not len(fences):
+        return [], inside
+    timestamps, lats, lngs = zip(*points)
+    membership = fences.membership(lats, lngs)
+    previous = np.vstack([np.isin(fences.ids, list(inside))[None, :], membership[:-1]])
+    rows, cols = np.nonzero(membership != previous)
+    events = [
+        _event(fences, fences._id_list[col], user_id, shift_id, membership[row, col], timestamps[row], lats[row], lngs[row])
+        for row, col in zip(rows.tolist(), cols.tolist())
+    ]
+    return events, frozenset(fences.ids[membership[-1]].tolist())
+
+
+class GeofenceMonitor:
+    """Live enter/exit detection on the ingest path.
+
+    Keeps, per worker, the fences their latest fix was inside, so an event is only
+    produced when that set changes. A new shift starts outside every fence.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fences = CompiledFences()
+        self._state = {}  # user_id -> (shift_id, latest timestamp, frozenset of fence ids)
+        self.pings = 0
+        self.events = 0
+        self.seconds = 0.0
+
+    def load(self, db, restore_state=False):
+        """(Re)compiles the company's active fences. `restore_state` rebuilds worker state from stored events (startup)."""
+        company = company_id(db)
+        fences = db.query(models.Geofence).filter(
+            models.Geofence.company_id == company, models.Geofence.is_active.is_(True)
+        ).order_by(models.Geofence.id).all()
+        compiled = CompiledFences(fences)
+        state = self._stored_state(db, company) if restore_state else None
+        known = frozenset(compiled._id_list)
+        with self._lock:
+            self._fences = compiled
+            if state is not None:
+                self._state = state
+            self._state = {user_id: (shift_id, latest, inside & known)
+                           for user_id, (shift_id, latest, inside) in self._state.items()}
+        return len(compiled)
+
+    @staticmethod
+    def _stored_state(db, company):
+        Event = models.GeofenceEvent
+        rows = db.query(Event.user_id, Event.shift_id, Event.geofence_id, Event.event, Event.timestamp).join(
+            models.Shift, models.Shift.id == Event.shift_id
+        ).filter(Event.company_id == company, models.Shift.status == "active").order_by(Event.id)
+        state = {}
+        for user_id, shift_id, geofence_id, event, timestamp in rows:
+            _, latest, inside = state.get(user_id, (shift_id, timestamp, frozenset()))
+            inside = inside | {geofence_id} if event == "enter" else inside - {geofence_id}
+            state[user_id] = (shift_id, max(latest, timestamp), inside)
+        return state
+
+    def _previous(self, user_id, shift_id):
+        """(latest timestamp, fences inside) for the worker's current shift."""
+        entry = self._state.get(user_id)
+        if entry is None or entry[0] != shift_id:
+            return None, frozenset()
+        return entry[1], entry[2]
+
+    def observe(self, user_id, shift_id, lat, lng, timestamp: datetime):
+        """Events caused by one stored ping (usually none)."""
+        fences = self._fences
+        if not len(fences):
+            return []
+        started = time.perf_counter()
+        inside = frozenset(fences.containing(lat, lng))
+        with self._lock:
+            latest, previous = self._previous(user_id, shift_id)
+            if latest is not None and timestamp < latest:
+                return []  # Late (buffered) fix: the state already reflects newer ones
+            self._state[user_id] = (shift_id, timestamp, inside)
+            events = [_event(fences, fence_id, user_id, shift_id, True, timestamp, lat, lng) for fence_id in sorted(inside - previous)]
+            events += [_event(fences, fence_id, user_id, shift_id, False, timestamp, lat, lng) for fence_id in sorted(previous - inside)]
+            self.pings += 1
+            self.events += len(events)
+            self.seconds += time.perf_counter() - started
+        return events
+
+    def observe_batch(self, user_id, shift_id, rows):
+        """Events caused by a batch of stored fixes (LocationLog row dicts), evaluated as one track."""
+        fences = self._fences
+        if not len(fences):
+            return []
+        started = time.perf_counter()
+        with self._lock:
+            latest, inside = self._previous(user_id, shift_id)
+        points = sorted((row["timestamp"], row["latitude"], row["longitude"]) for row in rows
+                        if latest is None or row["timestamp"] >= latest)
+        if not points:
+            return []
+        events, inside = track_events(fences, user_id, shift_id, points, inside)
+        with self._lock:
+            self._state[user_id] = (shift_id, points[-1][0], inside)
+            self.pings += len(points)
+            self.events += len(events)
+            self.seconds += time.perf_counter() - started
+        return events
+
+    def shift_ended(self, user_id, shift_id=None):
+        with self._lock:
+            entry = self._state.get(user_id)
+            if entry is not None and (shift_id is None or entry[0] == shift_id):
+                del self._state[user_id]
+
+    def stats(self):
+        return {
+            "fences": len(self._fences),
+            "tracked_workers": len(self._state),
+            "pings": self.pings,
+            "events": self.events,
+            "avg_us_per_ping": round(self.seconds / self.pings * 1e6, 1) if self.pings else 0.0
+        }
+
+
+def replay(db, fences: CompiledFences, start: datetime = None, end: datetime = None, worker_id: int = None):
+    """Batch mode: events along the stored tracks of shifts started in [start, end).
+
+    Each shift starts outside every fence. Nothing is written. Returns (events, stats).
+    """
+    query = db.query(models.Shift.id, models.Shift.user_id)
+    if start is not None:
+        query = query.filter(models.Shift.start_time >= start)
+    if end is not None:
+        query = query.filter(models.Shift.start_time < end)
+    if worker_id:
+        query = query.filter(models.Shift.user_id == worker_id)
+
+    events = []
+    stats = {"shifts": 0, "unavailable_shifts": 0, "pings": 0, "events": 0, "seconds": 0.0}
+    for shift_id, user_id in query.order_by(models.Shift.id).all():
+        try:
+            points = tracks.track_fixes(db, shift_id)
+        except archive.ArchiveError:
+            stats["unavailable_shifts"] += 1
+            continue
+        started = time.perf_counter()
+        shift_events, _ = track_events(fences, user_id, shift_id, points)
+        stats["seconds"] += time.perf_counter() - started
+        stats["shifts"] += 1
+        stats["pings"] += len(points)
+        events.extend(shift_events)
+    stats["events"] = len(events)
+    stats["pings_per_second"] = round(stats["pings"] / stats["seconds"]) if stats["seconds"] else 0
+    stats["seconds"] = round(stats["seconds"], 3)
+    return events, stats
+
+
+if __name__ == "__main__":
+    # python geofences.py [--from YYYY-MM-DD] [--to YYYY-MM-DD]   replays stored tracks against the active fences
+    args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+    db = database.SessionLocal()
+    try:
+        fences = db.query(models.Geofence).filter(
+            models.Geofence.company_id == company_id(db), models.Geofence.is_active.is_(True)
+        ).all()
+        start, end = exports.parse_range(args.get("--from"), args.get("--to"))
+        events, stats = replay(db, CompiledFences(fences), start=start, end=end)
+        print(f"{len(fences)} fence(s), {stats['shifts']} shift(s), {stats['pings']} ping(s): "
+              f"{stats['events']} event(s) in {stats['seconds']} s ({stats['pings_per_second']} pings/s)")
+    finally:
+        db.close()
@@ -0,0 +1,177 @@
+import os
+import queue
+import threading
+import time
+from sqlalchemy import insert
+import models
+
+# Write-behind mode for /location and /location/batch (opt-in): pings are acknowledged once queued and
+# written to the `locations` table in grouped INSERTs by a background flusher.
+WRITE_BEHIND_ENABLED = os.getenv("MML_WRITE_BEHIND", "0") == "1"
+# Max pings acknowledged but not yet flushed. When full, ingest falls back to a synchronous write.
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("MML_WRITE_BEHIND_MAX_PENDING", "5000"))
+# Flush when this many pings are queued...
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("MML_WRITE_BEHIND_BATCH_SIZE", "200"))
+# ...or when the oldest queued ping is this old.
+WRITE_BEHIND_INTERVAL_MS = int(os.getenv("MML_WRITE_BEHIND_INTERVAL_MS", "1000"))
+
+FLUSH_RETRIES = 3
+
+
+class LocationWriteBuffer:
+    def __init__(self, session_factory, max_pending=WRITE_BEHIND_MAX_PENDING,
+                 batch_size=WRITE_BEHIND_BATCH_SIZE, flush_interval_ms=WRITE_BEHIND_INTERVAL_MS):
+        self.session_factory = session_factory
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = {}  # shift_id -> {timestamp: queued rows}, until written or dropped (batch dedup)
+
+        # Tuning stats
+        self.flush_count = 0
+        self.rows_flushed = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.flush_errors = 0
+        self.rows_dropped = 0
+        self.sync_fallbacks = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="location-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops accepting work and drains everything already acknowledged."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def enqueue(self, row: dict) -> bool:
+        """Queues a LocationLog row. Returns False when the buffer is full (caller writes it directly)."""
+        if self._thread is None or self._stop.is_set():
+            return False
+        # Tracked before it is queued, so the flusher never untracks a row it hasn't counted
+        self._track(row, 1)
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self._track(row, -1)
+            with self._stats_lock:
+                self.sync_fallbacks += 1
+            return False
+
+    def _track(self, row, step):
+        with self._pending_lock:
+            times = self._pending.setdefault(row["shift_id"], {})
+            count = times.get(row["timestamp"], 0) + step
+            if count > 0:
+                times[row["timestamp"]] = count
+            else:
+                times.pop(row["timestamp"], None)
+                if not times:
+                    del self._pending[row["shift_id"]]
+
+    def pending(self, shift_id, timestamps):
+        """Those of `timestamps` the shift has rows queued at (acknowledged, not written yet)."""
+        with self._pending_lock:
+            times = self._pending.get(shift_id, {})
+            return {timestamp for timestamp in timestamps if timestamp in times}
+
+    def flush(self):
+        """Blocks until every ping queued so far has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+
+    def _collect(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                remaining = 0
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        written = False
+        try:
+            for attempt in range(1, FLUSH_RETRIES + 1):
+                db = self.session_factory()
+                try:
+                    db.execute(insert(models.LocationLog), batch)
+                    db.commit()
+                    written = True
+                    break
+                except Exception as e:
+                    db.rollback()
+                    with self._stats_lock:
+                        self.flush_errors += 1
+                    print(f">>> MML-SYSTEM: Write-behind flush failed (attempt {attempt}/{FLUSH_RETRIES}): {e}")
+                    if attempt == FLUSH_RETRIES:
+                        with self._stats_lock:
+                            self.rows_dropped += len(batch)
+                        print(f">>> MML-SYSTEM: Dropped {len(batch)} buffered locations")
+                    else:
+                        time.sleep(self.flush_interval)
+                finally:
+                    db.close()
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._stats_lock:
+                if written:
+                    self.flush_count += 1
+                    self.rows_flushed += len(batch)
+                self.last_batch_size = len(batch)
+                self.max_batch_size = max(self.max_batch_size, len(batch))
+                self.last_flush_ms = elapsed_ms
+            for row in batch:
+                self._track(row, -1)
+                self._queue.task_done()
+
+    def pressure(self):
+        """Queue fill, 0 to 1."""
+        return self._queue.qsize() / self.max_pending
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "enabled": True,
+                "queue_depth": self._queue.qsize(),
+                "max_pending": self.max_pending,
+                "batch_size": self.batch_size,
+                "flush_interval_ms": int(self.flush_interval * 1000),
+                "flush_count": self.flush_count,
+                "rows_flushed": self.rows_flushed,
+                "avg_batch_size": self.rows_flushed / self.flush_count if self.flush_count else 0,
+                "last_batch_size": self.last_batch_size,
+                "max_batch_size": self.max_batch_size,
+                "last_flush_ms": self.last_flush_ms,
+                "flush_errors": self.flush_errors,
+                "rows_dropped": self.rows_dropped,
+                "sync_fallbacks": self.sync_fallbacks,
+            }
@@ -0,0 +1,218 @@
+import asyncio
+import threading
+from sqlalchemy import and_, func
+import geo_index, models
+
+
+# Pending events per stream subscriber before it is reset to a fresh snapshot
+SUBSCRIBER_MAX_PENDING = 500
+
+
+class MapSubscriber:
+    """One live-map stream client.
+
+    Pending events are keyed by worker, so a slow client only ever receives the
+    latest state of each worker instead of every intermediate ping. If even that
+    overflows, the backlog is dropped and the client is sent a fresh snapshot.
+    """
+
+    def __init__(self, loop, max_pending=SUBSCRIBER_MAX_PENDING):
+        self.loop = loop
+        self.max_pending = max_pending
+        self.wakeup = asyncio.Event()
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._resync = False
+
+    def push(self, user_id, event):
+        with self._lock:
+            if user_id in self._pending:
+                del self._pending[user_id]
+                self.coalesced += 1
+            self._pending[user_id] = event
+            if len(self._pending) > self.max_pending:
+                self._pending.clear()
+                self._resync = True
+        self.notify()
+
+    def request_resync(self):
+        with self._lock:
+            self._pending.clear()
+            self._resync = True
+        self.notify()
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    def drain(self):
+        """Returns (needs_snapshot, events) and clears the backlog."""
+        self.wakeup.clear()
+        with self._lock:
+            events = list(self._pending.values())
+            resync = self._resync
+            self._pending = {}
+            self._resync = False
+        return resync, events
+
+
+class PositionStore:
+    """Last known position of every worker on an active shift, keyed by user id.
+
+    Kept in step by the ingest path and shift start/end, so /admin/workers-map
+    is served from memory instead of querying `shifts` and `locations`. Positions
+    are also held in a grid index for the proximity queries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = {}
+        self._index = geo_index.GridIndex()
+        self._subscribers = set()
+
+    def load(self, db):
+        """Rebuilds the store from the database with a single windowed query."""
+        ranked = db.query(
+            models.LocationLog.shift_id,
+            models.LocationLog.latitude,
+            models.LocationLog.longitude,
+            models.LocationLog.timestamp,
+            func.row_number().over(
+                partition_by=models.LocationLog.shift_id,
+                order_by=models.LocationLog.timestamp.desc()
+            ).label("rank")
+        ).join(models.Shift, models.Shift.id == models.LocationLog.shift_id).filter(
+            models.Shift.status == "active"
+        ).subquery()
+
+        rows = db.query(
+            models.Shift.id,
+            models.Shift.user_id,
+            models.User.full_name,
+            models.User.worker_number,
+            models.User.vehicle_type,
+            ranked.c.latitude,
+            ranked.c.longitude,
+            ranked.c.timestamp
+        ).join(models.User, models.User.id == models.Shift.user_id).outerjoin(
+            ranked, and_(ranked.c.shift_id == models.Shift.id, ranked.c.rank == 1)
+        ).filter(models.Shift.status == "active").order_by(models.Shift.id).all()
+
+        workers = {}
+        for shift_id, user_id, full_name, worker_number, vehicle_type, lat, lng, timestamp in rows:
+            workers[user_id] = {
+                "shift_id": shift_id,
+                "user_id": user_id,
+                "user": full_name,
+                "worker_number": worker_number,
+                "vehicle_type": vehicle_type,
+                "lat": lat,
+                "lng": lng,
+                "last_update": timestamp
+            }
+        index = geo_index.GridIndex()
+        for user_id, entry in workers.items():
+            if entry["lat"] is not None:
+                index.update(user_id, entry["lat"], entry["lng"])
+        with self._lock:
+            self._workers = workers
+            self._index = index
+            for subscriber in self._subscribers:
+                subscriber.request_resync()
+        return len(workers)
+
+    def shift_started(self, user, shift_id):
+        with self._lock:
+            entry = self._new_entry(user, shift_id)
+            self._workers[user.id] = entry
+            self._index.remove(user.id)
+            self._publish(user.id, {"type": "shift_start", "worker": self._public(entry)})
+
+    def shift_ended(self, user_id, shift_id=None):
+        with self._lock:
+            entry = self._workers.get(user_id)
+            if entry is not None and (shift_id is None or entry["shift_id"] == shift_id):
+                del self._workers[user_id]
+                self._index.remove(user_id)
+                self._publish(user_id, {"type": "shift_end", "user_id": user_id})
+
+    def update_position(self, user, shift_id, lat, lng, timestamp):
+        with self._lock:
+            entry = self._workers.get(user.id)
+            if entry is None or entry["shift_id"] != shift_id:
+                entry = self._new_entry(user, shift_id)
+                self._workers[user.id] = entry
+            # Late (buffered) fixes must not move the marker backwards in time
+            if entry["last_update"] is not None and timestamp < entry["last_update"]:
+                return
+            entry["lat"] = lat
+            entry["lng"] = lng
+            entry["last_update"] = timestamp
+            self._index.update(user.id, lat, lng)
+            self._publish(user.id, {"type": "position", "worker": self._public(entry)})
+
+    def snapshot(self):
+        """Workers with at least one position, in /admin/workers-map format."""
+        with self._lock:
+            return self._snapshot()
+
+    def nearest(self, lat, lng, k, max_distance_m=None):
+        """Up to k workers closest to (lat, lng), nearest first, with `distance_m`."""
+        with self._lock:
+            return self._with_distance(self._index.nearest(lat, lng, k, max_distance_m))
+
+    def within(self, lat, lng, radius_m):
+        """Workers within radius_m of (lat, lng), nearest first, with `distance_m`."""
+        with self._lock:
+            return self._with_distance(self._index.within(lat, lng, radius_m))
+
+    def in_bbox(self, min_lat, min_lng, max_lat, max_lng):
+        with self._lock:
+            return [self._public(self._workers[user_id]) for user_id in self._index.bbox(min_lat, min_lng, max_lat, max_lng)]
+
+    def _with_distance(self, found):
+        return [dict(self._public(self._workers[user_id]), distance_m=round(distance, 1)) for distance, user_id in found]
+
+    def subscribe(self, loop, max_pending=SUBSCRIBER_MAX_PENDING):
+        """Registers a stream client. Returns (subscriber, initial snapshot), taken atomically."""
+        subscriber = MapSubscriber(loop, max_pending)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            return subscriber, self._snapshot()
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def _snapshot(self):
+        return [self._public(entry) for entry in self._workers.values() if entry["last_update"] is not None]
+
+    def _publish(self, user_id, event):
+        for subscriber in self._subscribers:
+            subscriber.push(user_id, event)
+
+    def __len__(self):
+        return len(self._workers)
+
+    @staticmethod
+    def _public(entry):
+        return {key: value for key, value in entry.items() if key != "shift_id"}
+
+    @staticmethod
+    def _new_entry(user, shift_id):
+        return {
+            "shift_id": shift_id,
+            "user_id": user.id,
+            "user": user.full_name,
+            "worker_number": user.worker_number,
+            "vehicle_type": user.vehicle_type,
+            "lat": None,
+            "lng": None,
+            "last_update": None
+        }
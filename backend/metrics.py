@@ -0,0 +1,153 @@
+import bisect
+import os
+import threading
+import time
+from collections import defaultdict
+
+# Request metrics (a pure ASGI middleware) and the Prometheus text served on /metrics.
+# Requests are labelled by route template (/admin/shifts/{shift_id}/track), never by
+# raw path, so the number of series stays fixed; unmatched paths share one label.
+METRICS_ENABLED = os.getenv("MML_METRICS", "1") == "1"
+# When set, /metrics requires "Authorization: Bearer <token>" (Prometheus bearer_token)
+METRICS_TOKEN = os.getenv("MML_METRICS_TOKEN")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4"  # Starlette appends the charset
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}" if labels else ""
+
+
+def family(name, kind, help_text, samples):
+    """Exposition lines of one metric family. `samples` are (labels as ((name, value), ...), value)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_labels(labels)} {value}" for labels, value in samples]
+    return lines
+
+
+class Counters:
+    """Monotonic counters by (name, labels), for application events such as accepted pings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(int)
+        self._help = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        by_name = defaultdict(list)
+        for (name, labels), value in sorted(values.items()):
+            by_name[name].append((labels, value))
+        lines = []
+        for name, help_text in self._help.items():
+            lines += family(name, "counter", help_text, by_name.get(name) or [((), 0)])
+        return lines
+
+
+class RequestMetrics:
+    """Per-route request counts, errors and latency histograms, plus requests in flight."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = defaultdict(int)  # (method, route, status) -> count
+        self._errors = defaultdict(int)  # (method, route) -> 5xx responses and unhandled exceptions
+        self._latency = {}  # (method, route) -> [count per bucket..., +Inf, sum of seconds]
+        self.in_flight = 0
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, method, route, status, seconds):
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.in_flight -= 1
+            self._requests[(method, route, status)] += 1
+            if status >= 500:
+                self._errors[(method, route)] += 1
+            histogram = self._latency.get((method, route))
+            if histogram is None:
+                histogram = self._latency[(method, route)] = [0] * (len(self.buckets) + 2)
+            histogram[bucket] += 1
+            histogram[-1] += seconds
+
+    def render(self):
+        with self._lock:
+            requests = dict(self._requests)
+            errors = dict(self._errors)
+            latency = {key: list(histogram) for key, histogram in self._latency.items()}
+            in_flight = self.in_flight
+        lines = family("mml_http_requests_total", "counter", "HTTP requests by route and status.", [
+            ((("method", method), ("route", route), ("status", status)), count)
+            for (method, route, status), count in sorted(requests.items())
+        ])
+        lines += family("mml_http_request_errors_total", "counter", "HTTP 5xx responses and unhandled exceptions by route.", [
+            ((("method", method), ("route", route)), count) for (method, route), count in sorted(errors.items())
+        ])
+        lines += family("mml_http_requests_in_flight", "gauge", "HTTP requests being served.", [((), in_flight)])
+        lines += ["# HELP mml_http_request_duration_seconds Time to the end of the response body, by route.",
+                  "# TYPE mml_http_request_duration_seconds histogram"]
+        for (method, route), histogram in sorted(latency.items()):
+            labels = (("method", method), ("route", route))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), histogram):
+                cumulative += count
+                lines.append(f"mml_http_request_duration_seconds_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"mml_http_request_duration_seconds_sum{_labels(labels)} {histogram[-1]}")
+            lines.append(f"mml_http_request_duration_seconds_count{_labels(labels)} {cumulative}")
+        return lines
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no BaseHTTPMiddleware, so responses still stream).
+
+    The route template is read from the scope after the app has routed the request.
+    Latency runs to the last body chunk, so background tasks (track compaction after
+    /shifts/end) are not counted in the request.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        finished_at = None
+
+        async def send_and_observe(message):
+            nonlocal status, finished_at
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished_at = time.perf_counter()
+            await send(message)
+
+        self.metrics.started()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_and_observe)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            route = scope.get("route")
+            self.metrics.finished(scope["method"], getattr(route, "path", UNMATCHED_ROUTE), status,
+                                  (finished_at or time.perf_counter()) - started)
@@ -0,0 +1,164 @@
+import sys
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.orm import Session
+import models
+import database
+import geofences
+import rollups
+
+# Versioned schema migrations (replaces Base.metadata.create_all at import time).
+#
+# Every migration must be idempotent: migration 1 creates the *current* models on a
+# fresh database, so later steps have to tolerate objects that already exist.
+
+version_metadata = MetaData()
+schema_version = Table(
+    "schema_version", version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime, default=datetime.utcnow)
+)
+
+
+def _baseline(conn):
+    models.Base.metadata.create_all(bind=conn)
+
+
+def _add_missing_columns(conn):
+    # Databases created before these columns existed (create_all never alters tables)
+    columns = {
+        "users": [("vehicle_type", "VARCHAR DEFAULT 'car'")],
+        "shifts": [
+            ("start_location_lat", "FLOAT"),
+            ("start_location_lon", "FLOAT"),
+            ("end_location_lat", "FLOAT"),
+            ("end_location_lon", "FLOAT"),
+            ("incident_type", "VARCHAR DEFAULT 'normal'")
+        ]
+    }
+    inspector = inspect(conn)
+    for table, wanted in columns.items():
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        for name, ddl in wanted:
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+HOT_PATH_INDEXES = [
+    "ix_shifts_user_status",
+    "ix_shifts_start_time",
+    "ix_shifts_active_user",
+    "ix_locations_shift_timestamp",
+]
+
+
+def _index(name):
+    for table in models.Base.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(name)
+
+
+def _hot_path_indexes(conn):
+    for name in HOT_PATH_INDEXES:
+        _index(name).create(bind=conn, checkfirst=True)
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("ANALYZE"))
+
+
+def _worker_daily_hours(conn):
+    models.WorkerDailyHours.__table__.create(bind=conn, checkfirst=True)
+    _index("ix_worker_daily_hours_day").create(bind=conn, checkfirst=True)
+    session = Session(bind=conn)
+    result = rollups.rebuild(session)
+    session.flush()
+    print(f">>> MML-SYSTEM: Backfilled worker_daily_hours ({result['rows']} rows from {result['shifts']} shifts)")
+
+
+def _shift_tracks(conn):
+    models.ShiftTrack.__table__.create(bind=conn, checkfirst=True)
+
+
+def _shift_archive_path(conn):
+    existing = {column["name"] for column in inspect(conn).get_columns("shifts")}
+    if "archive_path" not in existing:
+        conn.execute(text("ALTER TABLE shifts ADD COLUMN archive_path VARCHAR"))
+
+
+def _geofences(conn):
+    models.Geofence.__table__.create(bind=conn, checkfirst=True)
+    models.GeofenceEvent.__table__.create(bind=conn, checkfirst=True)
+    for name in ("ix_geofence_events_shift", "ix_geofence_events_timestamp"):
+        _index(name).create(bind=conn, checkfirst=True)
+
+
+
+def _geofence_company(conn):
+    inspector = inspect(conn)
+    for table, ddl in (("geofences", "INTEGER REFERENCES company_settings(id)"), ("geofence_events", "INTEGER")):
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        if "company_id" not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN company_id {ddl}"))
+    # Fences and events created before companies owned them belong to the deployment's company
+    unowned = conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM geofences WHERE company_id IS NULL) OR EXISTS (SELECT 1 FROM geofence_events WHERE company_id IS NULL)"
+    )).scalar()
+    if unowned:
+        session = Session(bind=conn)
+        company_id = geofences.company_id(session)
+        for table in ("geofences", "geofence_events"):
+            conn.execute(text(f"UPDATE {table} SET company_id = :company_id WHERE company_id IS NULL"), {"company_id": company_id})
+    for name in ("ix_geofences_company", "ix_geofence_events_company"):
+        _index(name).create(bind=conn, checkfirst=True)
+
+
+def _shift_metrics(conn):
+    # Filled when shifts close; older shifts by the startup backfill or `python shift_metrics.py`
+    models.ShiftMetrics.__table__.create(bind=conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, "baseline tables", _baseline),
+    (2, "add columns missing from early databases", _add_missing_columns),
+    (3, "hot-path composite and partial indexes", _hot_path_indexes),
+    (4, "worker_daily_hours rollup", _worker_daily_hours),
+    (5, "shift_tracks (compacted GPS tracks)", _shift_tracks),
+    (6, "shifts.archive_path (archived GPS tracks)", _shift_archive_path),
+    (7, "geofences and geofence_events", _geofences),
+    (8, "shift_metrics (distance and speed per shift)", _shift_metrics),
+    (9, "geofences.company_id (fences belong to a company)", _geofence_company),
+]
+
+
+def current_version(engine):
+    version_metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        versions = conn.execute(select(schema_version.c.version)).scalars().all()
+    return max(versions, default=0)
+
+
+def run_migrations(engine=database.engine, target=None):
+    """Applies pending migrations up to `target` (default: latest). Returns the applied versions."""
+    applied = []
+    version = current_version(engine)
+    for number, description, migrate in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_version.insert().values(version=number, description=description, applied_at=datetime.utcnow()))
+        print(f">>> MML-SYSTEM: Applied migration {number} ({description})")
+        applied.append(number)
+    return applied
+
+
+if __name__ == "__main__":
+    if "--status" in sys.argv:
+        version = current_version(database.engine)
+        latest = MIGRATIONS[-1][0]
+        print(f"Schema version {version} (latest {latest})")
+    else:
+        applied = run_migrations()
+        print(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date.")
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Enum
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, Date, DateTime, Enum, Index, JSON, LargeBinary
 from sqlalchemy.orm import relationship
 from database import Base
 import enum
@@ -22,6 +22,7 @@ class User(Base):
     full_name = Column(String)
     role = Column(String, default="worker") # Stored as string, validated as Enum in schema
     worker_number = Column(Integer, nullable=True, unique=True) # Custom number (1-70)
+    vehicle_type = Column(String, default="car")  # car, motorcycle, scooter
     is_active = Column(Boolean, default=True)
 
     shifts = relationship("Shift", back_populates="worker")
@@ -35,6 +36,18 @@ class Shift(Base):
     end_time = Column(DateTime, nullable=True)
     status = Column(String, default="active") # active, paused, completed
     total_pause_time_minutes = Column(Integer, default=0)
+    
+    # GPS Locations for shift start/end
+    start_location_lat = Column(Float, nullable=True)
+    start_location_lon = Column(Float, nullable=True)
+    end_location_lat = Column(Float, nullable=True)
+    end_location_lon = Column(Float, nullable=True)
+    
+    # Incident tracking
+    incident_type = Column(String, default="normal")  # normal, olvido_salida, retraso
+
+    # GPS track moved to cold storage (file relative to archive.ARCHIVE_DIR)
+    archive_path = Column(String, nullable=True)
 
     worker = relationship("User", back_populates="shifts")
     locations = relationship("LocationLog", back_populates="shift")
@@ -49,3 +62,89 @@ class LocationLog(Base):
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
     
     shift = relationship("Shift", back_populates="locations")
+
+# Hot-path indexes (created for existing databases by migration 3, see migrations.py)
+Index("ix_shifts_user_status", Shift.user_id, Shift.status)
+Index("ix_shifts_start_time", Shift.start_time)
+Index("ix_shifts_active_user", Shift.user_id,
+      sqlite_where=Shift.status == "active", postgresql_where=Shift.status == "active")
+Index("ix_locations_shift_timestamp", LocationLog.shift_id, LocationLog.timestamp.desc())
+
+# Encoded GPS track of a closed shift, replacing its `locations` rows (see tracks.py / track_codec.py)
+class ShiftTrack(Base):
+    __tablename__ = "shift_tracks"
+
+    shift_id = Column(Integer, ForeignKey("shifts.id"), primary_key=True)
+    point_count = Column(Integer, default=0)
+    started_at = Column(DateTime)  # First and last fix, to select tracks by time range
+    ended_at = Column(DateTime)
+    encoded = Column(LargeBinary)
+
+# Per-worker daily totals of completed shifts, maintained incrementally (see rollups.py)
+class WorkerDailyHours(Base):
+    __tablename__ = "worker_daily_hours"
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)  # UTC calendar day
+    total_seconds = Column(Float, default=0)  # Completed shift time falling on this day
+    shift_count = Column(Integer, default=0)  # Shifts started this day
+    incident_count = Column(Integer, default=0)
+
+Index("ix_worker_daily_hours_day", WorkerDailyHours.day)
+
+# Distance / speed figures of a completed shift, computed from its track once (see shift_metrics.py)
+class ShiftMetrics(Base):
+    __tablename__ = "shift_metrics"
+
+    shift_id = Column(Integer, ForeignKey("shifts.id"), primary_key=True)
+    point_count = Column(Integer, default=0)
+    dropped_points = Column(Integer, default=0)  # Filtered out as GPS jumps or duplicates
+    distance_m = Column(Float, default=0)
+    moving_seconds = Column(Float, default=0)
+    idle_seconds = Column(Float, default=0)
+    gap_seconds = Column(Float, default=0)  # No fixes for longer than shift_metrics.MAX_GAP_SECONDS
+    max_speed_kmh = Column(Float, default=0)
+    avg_speed_kmh = Column(Float, default=0)  # While moving
+    computed_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class CompanySettings(Base):
+    __tablename__ = "company_settings"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_name = Column(String, default="MML-CONTROL")
+    company_cif = Column(String, nullable=True)
+    company_address = Column(String, nullable=True)
+    company_logo_url = Column(String, nullable=True)
+
+# Zones (depots, restaurants, restricted areas) checked against every ping (see geofences.py)
+class Geofence(Base):
+    __tablename__ = "geofences"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)
+    category = Column(String, default="depot")  # depot, restaurant, restricted
+    shape = Column(String, default="polygon")  # polygon, circle
+    points = Column(JSON, nullable=True)  # Polygon vertices as [[lat, lng], ...]
+    center_lat = Column(Float, nullable=True)  # Circle
+    center_lng = Column(Float, nullable=True)
+    radius_m = Column(Float, nullable=True)
+    is_active = Column(Boolean, default=True)
+    company_id = Column(Integer, ForeignKey("company_settings.id"), nullable=True)  # Owning company (see geofences.company_id)
+
+class GeofenceEvent(Base):
+    __tablename__ = "geofence_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    geofence_id = Column(Integer)  # Kept after the fence is deleted, like shifts of deleted workers
+    company_id = Column(Integer)  # Copied from the fence, so its events stay scoped after it is deleted
+    user_id = Column(Integer)
+    shift_id = Column(Integer)
+    event = Column(String)  # enter, exit
+    timestamp = Column(DateTime)
+    latitude = Column(Float)
+    longitude = Column(Float)
+
+Index("ix_geofence_events_shift", GeofenceEvent.shift_id, GeofenceEvent.id)
+Index("ix_geofence_events_timestamp", GeofenceEvent.timestamp)
+Index("ix_geofences_company", Geofence.company_id)
+Index("ix_geofence_events_company", GeofenceEvent.company_id, GeofenceEvent.id)
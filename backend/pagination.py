@@ -0,0 +1,82 @@
+import base64
+import json
+import os
+from datetime import datetime
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import DateTime, tuple_
+
+# Keyset (cursor) pagination and constant-memory streaming for list endpoints.
+DEFAULT_PAGE_SIZE = int(os.getenv("MML_PAGE_SIZE", "500"))
+MAX_PAGE_SIZE = int(os.getenv("MML_MAX_PAGE_SIZE", "5000"))
+STREAM_BATCH_SIZE = int(os.getenv("MML_STREAM_BATCH_SIZE", "1000"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_size(limit: int = None):
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    raw = json.dumps(jsonable_encoder(list(values)), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise InvalidCursor("Invalid cursor")
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) and value is not None else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def keyset_page(query, keys, cursor: str = None, limit: int = None, descending=False):
+    """Applies keyset ordering/filtering on `keys` ((name, column) pairs, the last one unique).
+
+    Returns (rows as dicts, next cursor or None). One extra row is fetched to know
+    whether another page exists; no OFFSET is ever used.
+    """
+    columns = [column for _, column in keys]
+    size = page_size(limit)
+    query = query.order_by(None)
+    if cursor:
+        after = tuple_(*columns) < tuple_(*decode_cursor(cursor, columns)) if descending \
+            else tuple_(*columns) > tuple_(*decode_cursor(cursor, columns))
+        query = query.filter(after)
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+
+    rows = [dict(row._mapping) for row in query.limit(size + 1)]
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, encode_cursor(rows[-1][name] for name, _ in keys)
+
+
+def stream_json_array(session_factory, build_query, batch_size=STREAM_BATCH_SIZE):
+    """Yields a JSON array row by row from a server-side cursor (constant memory).
+
+    The request's own session is closed before a streamed body is sent, so the
+    generator opens its own.
+    """
+    db = session_factory()
+    try:
+        yield "["
+        first = True
+        for row in build_query(db).yield_per(batch_size):
+            yield ("" if first else ",") + json.dumps(jsonable_encoder(dict(row._mapping)))
+            first = False
+        yield "]"
+    finally:
+        db.close()
@@ -0,0 +1,156 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+import geo_index
+
+# Stationary-ping suppression on the ingest path. A rider waiting at a restaurant still
+# pings every 15 s; while they stay within STATIONARY_RADIUS_M of the last stored fix
+# their pings are held back instead of stored. The dwell keeps its first fix (the last
+# stored one), its last fix (stored once they move off or the shift ends) and one fix
+# every STATIONARY_MAX_SECONDS, so tracks and shift metrics look the same.
+STATIONARY_FILTER_ENABLED = os.getenv("MML_STATIONARY_FILTER", "1") == "1"
+STATIONARY_RADIUS_M = float(os.getenv("MML_STATIONARY_RADIUS_M", "20"))
+# Below shift_metrics.MAX_GAP_SECONDS, so a long dwell still counts as idle time
+STATIONARY_MAX_SECONDS = float(os.getenv("MML_STATIONARY_MAX_SECONDS", "240"))
+# Timestamps of held-back fixes remembered per worker, so a retried batch is recognised as
+# duplicates (twice the app's offline buffer)
+SUPPRESSED_REMEMBERED = int(os.getenv("MML_STATIONARY_SUPPRESSED_REMEMBERED", "2000"))
+
+
+class StationaryFilter:
+    """Decides which pings are stored, per worker.
+
+    Holds the anchor (position and time of the last stored fix) and the latest
+    suppressed fix, plus the timestamps of the latest suppressed fixes of the shift for batch
+    deduplication (see suppressed). State is in memory only: after a restart the first ping of each
+    shift is stored as a new anchor. Held dwell ends are written on a clean shutdown
+    (drain_held) but lost if the process dies.
+    """
+
+    def __init__(self, enabled=STATIONARY_FILTER_ENABLED, radius_m=STATIONARY_RADIUS_M, max_seconds=STATIONARY_MAX_SECONDS,
+                 remembered=SUPPRESSED_REMEMBERED):
+        self.enabled = enabled
+        self.radius_m = radius_m
+        self.max_dwell = timedelta(seconds=max_seconds)
+        self.remembered = remembered
+        self._lock = threading.Lock()
+        self._state = {}  # user_id -> [shift_id, anchor lat, anchor lng, last stored timestamp, held row or None, stopped since]
+        self._suppressed = {}  # user_id -> (shift_id, OrderedDict of suppressed timestamps, oldest first)
+        self.pings = 0
+        self.stored = 0
+        self.dwell_ends = 0
+        self.heartbeats = 0
+
+    def _suppress(self, user_id, row):
+        entry = self._suppressed.get(user_id)
+        if entry is None or entry[0] != row["shift_id"]:
+            entry = self._suppressed[user_id] = (row["shift_id"], OrderedDict())
+        entry[1][row["timestamp"]] = None
+        if len(entry[1]) > self.remembered:
+            entry[1].popitem(last=False)
+        return []
+
+    def _admit(self, user_id, row):
+        """Rows to store for one fix (the caller holds the lock)."""
+        state = self._state.get(user_id)
+        anchor = [row["shift_id"], row["latitude"], row["longitude"], row["timestamp"], None, row["timestamp"]]
+        if state is None or state[0] != row["shift_id"]:
+            self._state[user_id] = anchor
+            return [row] if state is None or state[4] is None else [state[4], row]
+        _, lat, lng, stored_at, held, _ = state
+        near = geo_index.haversine_m(lat, lng, row["latitude"], row["longitude"]) <= self.radius_m
+        if row["timestamp"] < (held["timestamp"] if held else stored_at):
+            # Late (buffered) fix: stored as is, unless it falls inside the current dwell (a
+            # retried batch), which its stored start and held end already stand for
+            return self._suppress(user_id, row) if near and held is not None and row["timestamp"] >= stored_at else [row]
+        if near:
+            if row["timestamp"] - stored_at < self.max_dwell:
+                state[4] = row
+                return self._suppress(user_id, row)
+            # Heartbeat: the anchor keeps its position so slow GPS drift can't walk it away
+            state[3], state[4] = row["timestamp"], None
+            self.heartbeats += 1
+            return [row]
+        self._state[user_id] = anchor
+        if held is None:
+            return [row]
+        self.dwell_ends += 1
+        return [held, row]
+
+    def admit(self, user_id, row):
+        """LocationLog rows to store for one ping: none while the worker stands still, the
+        held dwell end followed by the ping once they move off."""
+        if not self.enabled:
+            return [row]
+        with self._lock:
+            rows = self._admit(user_id, row)
+            self.pings += 1
+            self.stored += len(rows)
+        return rows
+
+    def admit_batch(self, user_id, rows):
+        """Rows to store for a batch of fixes, taken in time order."""
+        if not self.enabled:
+            return rows
+        with self._lock:
+            stored = [kept for row in sorted(rows, key=lambda row: row["timestamp"]) for kept in self._admit(user_id, row)]
+            self.pings += len(rows)
+            self.stored += len(stored)
+        return stored
+
+    def stationary_seconds(self, user_id):
+        """How long the worker has stayed within the radius of their anchor (0 right after moving)."""
+        with self._lock:
+            state = self._state.get(user_id)
+            if state is None:
+                return 0.0
+            latest = state[4]["timestamp"] if state[4] else state[3]
+            return (latest - state[5]).total_seconds()
+
+    def suppressed(self, user_id, shift_id, timestamps):
+        """Those of `timestamps` this shift's fixes were held back at (not in `locations`)."""
+        with self._lock:
+            entry = self._suppressed.get(user_id)
+            if entry is None or entry[0] != shift_id:
+                return set()
+            return {timestamp for timestamp in timestamps if timestamp in entry[1]}
+
+    def shift_ended(self, user_id, shift_id=None):
+        """Forgets the worker's shift. Returns the held dwell end (if any) for the caller to store."""
+        with self._lock:
+            state = self._state.get(user_id)
+            if state is None or (shift_id is not None and state[0] != shift_id):
+                return []
+            del self._state[user_id]
+            self._suppressed.pop(user_id, None)
+            if state[4] is None:
+                return []
+            self.stored += 1
+            self.dwell_ends += 1
+            return [state[4]]
+
+    def drain_held(self):
+        """Releases every held dwell end (at shutdown). Anchors stay, so later pings still compare against them."""
+        with self._lock:
+            held = [state[4] for state in self._state.values() if state[4] is not None]
+            for state in self._state.values():
+                state[4] = None
+            self.stored += len(held)
+            self.dwell_ends += len(held)
+            return held
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "radius_m": self.radius_m,
+                "max_dwell_seconds": self.max_dwell.total_seconds(),
+                "tracked_workers": len(self._state),
+                "pings": self.pings,
+                "stored": self.stored,
+                "suppressed": self.pings - self.stored,
+                "suppressed_pct": round((self.pings - self.stored) / self.pings * 100, 1) if self.pings else 0.0,
+                "dwell_ends": self.dwell_ends,
+                "heartbeats": self.heartbeats
+            }
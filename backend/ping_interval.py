@@ -0,0 +1,95 @@
+import os
+import threading
+
+# Recommended seconds until a worker's next /location ping (`next_ping_seconds` in the
+# response). Workers standing still are backed off, and every interval is stretched
+# while ingest is overloaded so the fleet-wide ping rate drops with it.
+PING_INTERVAL_S = int(os.getenv("MML_PING_INTERVAL", "15"))
+# Each IDLE_BACKOFF_S spent stationary doubles the interval, up to IDLE_MAX_INTERVAL_S
+IDLE_BACKOFF_S = int(os.getenv("MML_PING_IDLE_BACKOFF", "60"))
+IDLE_MAX_INTERVAL_S = int(os.getenv("MML_PING_IDLE_MAX_INTERVAL", "60"))
+# Hard cap, overload included
+MAX_INTERVAL_S = int(os.getenv("MML_PING_MAX_INTERVAL", "120"))
+# Fleet-wide /location pings per second the server should receive (0 = no limit)
+INGEST_TARGET_RATE = float(os.getenv("MML_INGEST_TARGET_RATE", "0"))
+# Write-behind queue fill above which intervals are stretched
+QUEUE_PRESSURE_START = 0.5
+RATE_WINDOW_S = 10
+
+
+class PingScheduler:
+    """Picks the next ping interval from the worker's movement and the ingest load.
+
+    Load is the larger of two factors: the write-behind queue fill (`pressure`, a
+    callable returning 0 to 1) past QUEUE_PRESSURE_START, and the measured ping rate
+    against `target_rate`. The rate factor is corrected once per RATE_WINDOW_S by
+    rate / target, so it settles where the fleet pings at the target rate.
+    """
+
+    def __init__(self, pressure=None, base=PING_INTERVAL_S, idle_backoff=IDLE_BACKOFF_S, idle_max=IDLE_MAX_INTERVAL_S,
+                 max_interval=MAX_INTERVAL_S, target_rate=INGEST_TARGET_RATE):
+        self.pressure = pressure
+        self.base = base
+        self.idle_backoff = idle_backoff
+        self.idle_max = max(idle_max, base)
+        self.max_interval = max(max_interval, base)
+        self.target_rate = target_rate
+        self.max_throttle = self.max_interval / base
+        self._lock = threading.Lock()
+        self._window_start = None
+        self._window_pings = 0
+        self.rate = 0.0
+        self.throttle = 1.0
+        self.recommendations = 0
+        self.interval_total = 0
+        self.backed_off = 0
+        self.throttled = 0
+
+    def _count_ping(self, now):
+        if self._window_start is None:
+            self._window_start = now
+        self._window_pings += 1
+        elapsed = (now - self._window_start).total_seconds()
+        if elapsed >= RATE_WINDOW_S:
+            self.rate = self._window_pings / elapsed
+            if self.target_rate:
+                self.throttle = min(max(self.throttle * self.rate / self.target_rate, 1.0), self.max_throttle)
+            self._window_start, self._window_pings = now, 0
+
+    def _load(self):
+        load = self.throttle
+        if self.pressure is not None:
+            fill = self.pressure()
+            if fill > QUEUE_PRESSURE_START:
+                load = max(load, 1 + (fill - QUEUE_PRESSURE_START) / (1 - QUEUE_PRESSURE_START) * (self.max_throttle - 1))
+        return load
+
+    def next_interval(self, stationary_seconds: float, now):
+        """Seconds until the next ping, for a worker stationary for `stationary_seconds` (ping received at `now`)."""
+        with self._lock:
+            self._count_ping(now)
+            interval = self.base
+            if stationary_seconds >= self.idle_backoff:
+                interval = min(self.base * 2 ** min(int(stationary_seconds // self.idle_backoff), 8), self.idle_max)
+                self.backed_off += 1
+            load = self._load()
+            if load > 1:
+                self.throttled += 1
+            interval = min(round(interval * load), self.max_interval)
+            self.recommendations += 1
+            self.interval_total += interval
+        return interval
+
+    def stats(self):
+        with self._lock:
+            return {
+                "base_interval_s": self.base,
+                "max_interval_s": self.max_interval,
+                "target_rate": self.target_rate,
+                "ping_rate": round(self.rate, 2),
+                "load_factor": round(self._load(), 2),
+                "recommendations": self.recommendations,
+                "avg_interval_s": round(self.interval_total / self.recommendations, 1) if self.recommendations else 0.0,
+                "backed_off": self.backed_off,
+                "throttled": self.throttled
+            }
@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Resolved principals (schemas.User) by token subject, so authenticated requests
+# skip the `users` lookup. PRINCIPAL_CACHE_TTL=0 disables the cache.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("MML_PRINCIPAL_CACHE_SIZE", "1024"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("MML_PRINCIPAL_CACHE_TTL", "60"))
+
+
+class PrincipalCache:
+    def __init__(self, max_size=PRINCIPAL_CACHE_SIZE, ttl_seconds=PRINCIPAL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Bumped on every invalidation so a lookup that raced with it cannot re-insert stale data
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, subject):
+        """Returns (principal or None, generation). Pass the generation back to put()."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(subject)
+                self.hits += 1
+                return entry[0], self._generation
+            if entry is not None:
+                del self._entries[subject]
+            self.misses += 1
+            return None, self._generation
+
+    def put(self, subject, principal, generation):
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[subject] = (principal, time.monotonic() + self.ttl)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, subject=None):
+        """Drops one principal (or all of them when subject is None)."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if subject is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(subject, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0,
+                "invalidations": self.invalidations,
+            }
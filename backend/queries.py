@@ -0,0 +1,151 @@
+from datetime import datetime
+from sqlalchemy import Float, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+import models
+
+
+# --- SQL DATE ARITHMETIC ---
+
+class seconds_between(FunctionElement):
+    """Seconds from the first to the second DateTime expression, on SQLite and PostgreSQL."""
+    type = Float()
+    name = "seconds_between"
+    inherit_cache = True
+
+
+@compiles(seconds_between)
+def _seconds_between_default(element, compiler, **kw):
+    start, end = [compiler.process(clause, **kw) for clause in element.clauses]
+    return f"EXTRACT(EPOCH FROM ({end} - {start}))"
+
+
+@compiles(seconds_between, "sqlite")
+def _seconds_between_sqlite(element, compiler, **kw):
+    start, end = [compiler.process(clause, **kw) for clause in element.clauses]
+    # SQLite stores 'YYYY-MM-DD HH:MM:SS.ffffff' and its date functions round to milliseconds,
+    # so whole seconds come from the first 19 characters and the microseconds from the rest.
+    return (
+        f"((strftime('%s', substr({end}, 1, 19)) - strftime('%s', substr({start}, 1, 19))) + "
+        f"(CAST(substr({end}, 20) AS REAL) - CAST(substr({start}, 20) AS REAL)))"
+    )
+
+
+def hours_between(start, end):
+    return seconds_between(start, end) / 3600.0
+
+
+# --- SHIFT RANGE QUERIES ---
+
+# Column projection available to shift listings (one joined SELECT, no ORM objects)
+SHIFT_FIELDS = {
+    "id": models.Shift.id,
+    "worker_id": models.Shift.user_id,
+    "worker_name": models.User.full_name,
+    "worker_number": models.User.worker_number,
+    "start_time": models.Shift.start_time,
+    "end_time": models.Shift.end_time,
+    "duration_hours": hours_between(models.Shift.start_time, models.Shift.end_time),
+    "status": models.Shift.status,
+    "incident_type": models.Shift.incident_type,
+    "start_lat": models.Shift.start_location_lat,
+    "start_lon": models.Shift.start_location_lon,
+    "end_lat": models.Shift.end_location_lat,
+    "end_lon": models.Shift.end_location_lon,
+}
+
+SHIFT_LIST_FIELDS = ("id", "worker_name", "worker_number", "start_time", "end_time", "status")
+SHIFT_VIEW_FIELDS = ("id", "worker_name", "worker_number", "start_time", "end_time", "duration_hours", "status")
+SHIFT_EXPORT_FIELDS = ("id", "worker_id", "worker_name", "worker_number", "start_time", "end_time",
+                       "duration_hours", "status", "incident_type")
+
+
+def shift_range_query(db, fields=SHIFT_VIEW_FIELDS, start: datetime = None, end: datetime = None,
+                      end_inclusive=False, worker_id: int = None, status: str = None, incident_type: str = None):
+    """Shifts started in [start, end) (or [start, end] with end_inclusive), as a single query.
+
+    Duration is computed in SQL (NULL while the shift is open). Shifts of deleted
+    workers are kept, with empty worker fields.
+    """
+    query = db.query(*[SHIFT_FIELDS[name].label(name) for name in fields]).select_from(models.Shift).outerjoin(
+        models.User, models.User.id == models.Shift.user_id
+    )
+    if start is not None:
+        query = query.filter(models.Shift.start_time >= start)
+    if end is not None:
+        query = query.filter(models.Shift.start_time <= end if end_inclusive else models.Shift.start_time < end)
+    if worker_id:
+        query = query.filter(models.Shift.user_id == worker_id)
+    if status:
+        query = query.filter(models.Shift.status == status)
+    if incident_type:
+        query = query.filter(models.Shift.incident_type == incident_type)
+    return query.order_by(models.Shift.id)
+
+
+def shift_range(db, fields=SHIFT_VIEW_FIELDS, **filters):
+    return [dict(row._mapping) for row in shift_range_query(db, fields, **filters)]
+
+
+# GPS track rows with their worker, in insertion order (no sort, so it streams from a cursor)
+LOCATION_EXPORT_FIELDS = ("shift_id", "worker_id", "worker_name", "worker_number", "timestamp", "latitude", "longitude")
+
+
+def location_export_query(db, start: datetime = None, end: datetime = None, worker_id: int = None, shift_id: int = None):
+    query = db.query(
+        models.LocationLog.shift_id.label("shift_id"),
+        models.Shift.user_id.label("worker_id"),
+        models.User.full_name.label("worker_name"),
+        models.User.worker_number.label("worker_number"),
+        models.LocationLog.timestamp.label("timestamp"),
+        models.LocationLog.latitude.label("latitude"),
+        models.LocationLog.longitude.label("longitude")
+    ).join(models.Shift, models.Shift.id == models.LocationLog.shift_id).outerjoin(
+        models.User, models.User.id == models.Shift.user_id
+    )
+    if start is not None:
+        query = query.filter(models.LocationLog.timestamp >= start)
+    if end is not None:
+        query = query.filter(models.LocationLog.timestamp < end)
+    if worker_id:
+        query = query.filter(models.Shift.user_id == worker_id)
+    if shift_id:
+        query = query.filter(models.LocationLog.shift_id == shift_id)
+    return query.order_by(models.LocationLog.id)
+
+
+# Public worker fields (schemas.User), without loading User objects
+WORKER_FIELDS = ("id", "email", "full_name", "is_active", "role", "worker_number", "vehicle_type")
+
+
+def worker_list_query(db):
+    return db.query(*[getattr(models.User, name) for name in WORKER_FIELDS]).order_by(models.User.id)
+
+
+# --- REPORTS ---
+
+def hours_summary(db, worker_id: int = None, start: datetime = None, end: datetime = None):
+    """Completed hours and shift count per worker, grouped in the database."""
+    duration = hours_between(models.Shift.start_time, models.Shift.end_time)
+    query = db.query(
+        models.User.full_name,
+        models.User.worker_number,
+        func.coalesce(func.sum(duration), 0).label("total_hours"),
+        func.count(models.Shift.end_time).label("shift_count")
+    ).join(models.User, models.User.id == models.Shift.user_id).filter(models.Shift.status == "completed")
+
+    if worker_id:
+        query = query.filter(models.Shift.user_id == worker_id)
+    if start:
+        query = query.filter(models.Shift.start_time >= start)
+    if end:
+        query = query.filter(models.Shift.start_time <= end)
+
+    # Same worker order as the old per-shift loop (first shift seen first)
+    rows = query.group_by(models.User.id, models.User.full_name, models.User.worker_number).order_by(func.min(models.Shift.id)).all()
+    return [{
+        "worker_name": row.full_name,
+        "worker_number": row.worker_number,
+        "total_hours": row.total_hours,
+        "shift_count": row.shift_count
+    } for row in rows]
@@ -0,0 +1,180 @@
+import sys
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+import models
+import database
+
+# Per-worker, per-day rollup of completed shifts (worker_daily_hours).
+#
+# Updated in the same transaction that completes a shift, so reports read
+# days x workers rows instead of every shift. Days are UTC calendar days, like
+# every other timestamp in the API. Hours are split at midnight; the shift and
+# its incident are counted on the day it started (as the per-shift reports do).
+#
+# Read by /admin/reports/monthly/{year}/{month} and /admin/reports/hours_summary?source=rollup.
+# Deliberately left on the shifts table:
+#   /admin/reports/hours_summary (default): attributes each shift's full hours to the day it
+#     started, which the midnight split can't reproduce for ranges cutting through a shift.
+#   /admin/shifts/monthly/{year}/{month} (and daily/weekly): lists individual shifts, with
+#     status and incident filters the rollup doesn't keep. Not an aggregate.
+REBUILD_BATCH_SIZE = 5000
+
+
+def is_incident(incident_type):
+    return incident_type not in (None, "normal")
+
+
+def day_segments(start: datetime, end: datetime):
+    """Yields (day, seconds) for each calendar day covered by [start, end)."""
+    current = start
+    while current < end:
+        next_midnight = datetime.combine(current.date() + timedelta(days=1), time.min)
+        segment_end = min(end, next_midnight)
+        yield current.date(), (segment_end - current).total_seconds()
+        current = segment_end
+
+
+def shift_contributions(start: datetime, end: datetime, incident_type=None, sign=1):
+    """{day: (seconds, shifts, incidents)} that one completed shift adds to the rollup."""
+    contributions = {day: [sign * seconds, 0, 0] for day, seconds in day_segments(start, end)}
+    first = contributions.setdefault(start.date(), [0.0, 0, 0])
+    first[1] += sign
+    first[2] += sign if is_incident(incident_type) else 0
+    return contributions
+
+
+def _upsert(db, rows):
+    table = models.WorkerDailyHours.__table__
+    insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.day],
+        set_={
+            "total_seconds": table.c.total_seconds + statement.excluded.total_seconds,
+            "shift_count": table.c.shift_count + statement.excluded.shift_count,
+            "incident_count": table.c.incident_count + statement.excluded.incident_count,
+        }
+    )
+    db.execute(statement, rows)
+
+
+def apply_shift(db, user_id: int, start: datetime, end: datetime, incident_type=None, sign=1):
+    """Adds (sign=1) or removes (sign=-1) a completed shift. The caller commits."""
+    if user_id is None or start is None or end is None:
+        return
+    _upsert(db, [
+        {"user_id": user_id, "day": day, "total_seconds": seconds, "shift_count": shifts, "incident_count": incidents}
+        for day, (seconds, shifts, incidents) in shift_contributions(start, end, incident_type, sign).items()
+    ])
+
+
+def rebuild(db, start: date = None, end: date = None):
+    """Recomputes the rollup from shifts, for all days or the days in [start, end]. The caller commits.
+
+    Shifts crossing the window edges are read too, so the rebuilt days are complete.
+    """
+    Shift = models.Shift
+    query = db.query(Shift.user_id, Shift.start_time, Shift.end_time, Shift.incident_type).filter(
+        Shift.status == "completed", Shift.end_time.isnot(None), Shift.user_id.isnot(None)
+    )
+    if start is not None:
+        query = query.filter(Shift.end_time >= datetime.combine(start, time.min))
+    if end is not None:
+        query = query.filter(Shift.start_time < datetime.combine(end + timedelta(days=1), time.min))
+
+    totals = defaultdict(lambda: [0.0, 0, 0])
+    shifts = 0
+    for user_id, start_time, end_time, incident_type in query.yield_per(REBUILD_BATCH_SIZE):
+        shifts += 1
+        for day, values in shift_contributions(start_time, end_time, incident_type).items():
+            if (start is None or day >= start) and (end is None or day <= end):
+                total = totals[(user_id, day)]
+                for i, value in enumerate(values):
+                    total[i] += value
+
+    rollup = db.query(models.WorkerDailyHours)
+    if start is not None:
+        rollup = rollup.filter(models.WorkerDailyHours.day >= start)
+    if end is not None:
+        rollup = rollup.filter(models.WorkerDailyHours.day <= end)
+    rollup.delete(synchronize_session=False)
+
+    rows = [
+        {"user_id": user_id, "day": day, "total_seconds": seconds, "shift_count": count, "incident_count": incidents}
+        for (user_id, day), (seconds, count, incidents) in totals.items()
+    ]
+    for i in range(0, len(rows), REBUILD_BATCH_SIZE):
+        db.execute(models.WorkerDailyHours.__table__.insert(), rows[i:i + REBUILD_BATCH_SIZE])
+    return {"shifts": shifts, "rows": len(rows)}
+
+
+def rollup_hours_summary(db, worker_id: int = None, start: date = None, end: date = None):
+    """hours_summary from the rollup: completed hours and shift count per worker over whole days."""
+    rollup = models.WorkerDailyHours
+    query = db.query(
+        models.User.full_name,
+        models.User.worker_number,
+        func.coalesce(func.sum(rollup.total_seconds), 0).label("total_seconds"),
+        func.coalesce(func.sum(rollup.shift_count), 0).label("shift_count")
+    ).join(models.User, models.User.id == rollup.user_id)
+
+    if worker_id:
+        query = query.filter(rollup.user_id == worker_id)
+    if start:
+        query = query.filter(rollup.day >= start)
+    if end:
+        query = query.filter(rollup.day <= end)
+
+    rows = query.group_by(models.User.id, models.User.full_name, models.User.worker_number).order_by(
+        models.User.worker_number, models.User.id
+    ).all()
+    return [{
+        "worker_name": row.full_name,
+        "worker_number": row.worker_number,
+        "total_hours": row.total_seconds / 3600,
+        "shift_count": row.shift_count
+    } for row in rows]
+
+
+def daily_hours(db, start: date, end: date, worker_id: int = None):
+    """Per-worker, per-day rows in [start, end]."""
+    rollup = models.WorkerDailyHours
+    query = db.query(
+        rollup.user_id.label("worker_id"),
+        models.User.full_name.label("worker_name"),
+        models.User.worker_number.label("worker_number"),
+        rollup.day,
+        rollup.total_seconds,
+        rollup.shift_count,
+        rollup.incident_count
+    ).join(models.User, models.User.id == rollup.user_id).filter(rollup.day >= start, rollup.day <= end)
+    if worker_id:
+        query = query.filter(rollup.user_id == worker_id)
+
+    return [{
+        "worker_id": row.worker_id,
+        "worker_name": row.worker_name,
+        "worker_number": row.worker_number,
+        "day": row.day,
+        "total_hours": row.total_seconds / 3600,
+        "shift_count": row.shift_count,
+        "incident_count": row.incident_count
+    } for row in query.order_by(models.User.worker_number, rollup.user_id, rollup.day)]
+
+
+if __name__ == "__main__":
+    # python rollups.py [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+    args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+    db = database.SessionLocal()
+    try:
+        result = rebuild(
+            db,
+            start=date.fromisoformat(args["--from"]) if "--from" in args else None,
+            end=date.fromisoformat(args["--to"]) if "--to" in args else None
+        )
+        db.commit()
+        print(f"Rebuilt worker_daily_hours: {result['rows']} row(s) from {result['shifts']} shift(s)")
+    finally:
+        db.close()
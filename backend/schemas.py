@@ -9,12 +9,14 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
     worker_number: Optional[int] = None
+    vehicle_type: Optional[str] = "car"
 
 class User(UserBase):
     id: int
     is_active: bool
     role: str
     worker_number: Optional[int] = None
+    vehicle_type: Optional[str] = "car"
 
     class Config:
         from_attributes = True
@@ -39,9 +41,31 @@ class LocationCreate(BaseModel):
     latitude: float
     longitude: float
 
+class LocationFix(LocationCreate):
+    timestamp: Optional[datetime] = None # Client-side capture time (UTC)
+
+class LocationBatch(BaseModel):
+    locations: List[LocationFix]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
 
 class TokenData(BaseModel):
     email: Optional[str] = None
+
+class GeofenceCreate(BaseModel):
+    name: str
+    category: str = "depot"  # depot, restaurant, restricted
+    shape: str = "polygon"  # polygon, circle
+    points: Optional[List[List[float]]] = None  # Polygon vertices as [[lat, lng], ...]
+    center_lat: Optional[float] = None
+    center_lng: Optional[float] = None
+    radius_m: Optional[float] = None
+    is_active: bool = True
+
+class Geofence(GeofenceCreate):
+    id: int
+
+    class Config:
+        from_attributes = True
@@ -1,3 +1,4 @@
+import os
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -7,11 +8,24 @@ SECRET_KEY = "SECRET_KEY_CHANGE_ME_IN_PROD"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Live map stream: EventSource can't send headers, so its token travels in the URL (and
+# into access logs). It gets its own token, valid only for the stream and only briefly.
+STREAM_TOKEN_SCOPE = "live_map_stream"
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.getenv("MML_STREAM_TOKEN_SECONDS", "60"))
+
+# bcrypt cost (each +1 doubles hashing time). Hashes made with another cost still verify
+# and are upgraded/downgraded on the next login (see verify_and_update).
+BCRYPT_ROUNDS = int(os.getenv("MML_BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update(plain_password, hashed_password):
+    """(valid, new hash or None when the stored hash already uses the current settings)"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
@@ -0,0 +1,250 @@
+import os
+import sys
+from datetime import datetime
+import numpy as np
+from sqlalchemy import func
+import archive
+import database
+import exports
+import geo_index
+import models
+import tracks
+
+# Distance and speed per shift (mileage is paid by kilometres driven).
+#
+# A track is loaded as contiguous arrays and every figure is computed with NumPy over
+# its segments. Fixes that would need an impossible speed from the previous kept fix
+# are GPS jumps and are dropped. Completed shifts are computed once and cached in
+# `shift_metrics`: when they close, by the backfill at startup (older shifts, or closes
+# whose background task never ran) and by POST /admin/reports/rebuild_rollup. Reads
+# never write: a completed shift that is not cached yet is computed on the fly.
+MAX_SPEED_KMH = float(os.getenv("MML_MAX_SPEED_KMH", "160"))  # Faster than this is a GPS jump
+MOVING_SPEED_KMH = float(os.getenv("MML_MOVING_SPEED_KMH", "3"))  # Slower than this is idle (GPS drift)
+MAX_GAP_SECONDS = float(os.getenv("MML_MAX_GAP_SECONDS", "300"))  # Longer without fixes: neither moving nor idle
+JUMP_MAX_RUN = 8  # Consecutive unreachable fixes before a jump is taken as a real relocation
+CACHE_BATCH_SIZE = 200
+BACKFILL_ON_STARTUP = os.getenv("MML_SHIFT_METRICS_BACKFILL", "1") == "1"
+
+METRIC_FIELDS = ("point_count", "dropped_points", "distance_m", "moving_seconds", "idle_seconds", "gap_seconds",
+                 "max_speed_kmh", "avg_speed_kmh")
+
+
+def _segment_lengths_m(lats, lngs):
+    phi = np.radians(lats)
+    a = np.sin(np.diff(phi) / 2) ** 2 + np.cos(phi[:-1]) * np.cos(phi[1:]) * np.sin(np.radians(np.diff(lngs)) / 2) ** 2
+    return 2 * geo_index.EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _jump_filter(seconds, lats, lngs):
+    """Indexes of the fixes kept: a fix is dropped if reaching it from the previous kept fix is
+    too fast (or takes no time).
+
+    Segments are screened with NumPy; only the fixes after a suspicious segment are walked one
+    by one. After JUMP_MAX_RUN unreachable fixes in a row the position is accepted as a real
+    relocation (e.g. GPS reacquired after a tunnel).
+    """
+    max_speed = MAX_SPEED_KMH / 3.6
+    keep = np.ones(len(seconds), dtype=bool)
+    if len(seconds) < 2:
+        return np.flatnonzero(keep)
+
+    def reachable(a, b):
+        dt = seconds[b] - seconds[a]
+        return dt > 0 and geo_index.haversine_m(lats[a], lngs[a], lats[b], lngs[b]) <= max_speed * dt
+
+    dt = np.diff(seconds)
+    suspicious = np.flatnonzero((dt <= 0) | (_segment_lengths_m(lats, lngs) > max_speed * dt)) + 1
+    next_free = 0
+    for first in suspicious.tolist():
+        if first < next_free:
+            continue  # Already walked
+        anchor = first - 1  # Kept: its own incoming segment was fine, or a walk ended on it
+        if anchor == 0 and first + 1 < len(seconds) and reachable(first, first + 1) and not reachable(anchor, first + 1):
+            keep[0] = False  # The first fix is the outlier, not the second
+            next_free = first + 1
+            continue
+        candidate = first
+        while candidate < len(seconds) and not reachable(anchor, candidate):
+            if candidate - first >= JUMP_MAX_RUN and seconds[candidate] > seconds[anchor]:
+                break
+            keep[candidate] = False
+            candidate += 1
+        next_free = candidate + 1
+    return np.flatnonzero(keep)
+
+
+def compute(seconds, lats, lngs):
+    """Metrics of one track given as arrays (epoch seconds, lat, lng) in time order."""
+    seconds = np.asarray(seconds, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    lngs = np.asarray(lngs, dtype=float)
+    kept = _jump_filter(seconds, lats, lngs)
+    result = dict.fromkeys(METRIC_FIELDS, 0.0)
+    result["point_count"] = len(seconds)
+    result["dropped_points"] = len(seconds) - len(kept)
+    if len(kept) < 2:
+        return result
+
+    distance = _segment_lengths_m(lats[kept], lngs[kept])
+    dt = np.diff(seconds[kept])
+    speed = distance / dt
+    gap = dt > MAX_GAP_SECONDS
+    moving = ~gap & (speed >= MOVING_SPEED_KMH / 3.6)
+    moving_seconds = float(dt[moving].sum())
+    result.update(
+        distance_m=float(distance.sum()),
+        moving_seconds=moving_seconds,
+        idle_seconds=float(dt[~gap & ~moving].sum()),
+        gap_seconds=float(dt[gap].sum()),
+        max_speed_kmh=float(speed[moving].max() * 3.6) if moving.any() else 0.0,
+        avg_speed_kmh=float(distance[moving].sum() / moving_seconds * 3.6) if moving_seconds else 0.0
+    )
+    return result
+
+
+def track_arrays(db, shift_id: int):
+    """(unix seconds, lats, lngs) arrays of the stored track (raw, compacted or archived)."""
+    return tuple(np.array(column, dtype=float) for column in tracks.track_columns(db, shift_id))
+
+
+def compute_shift(db, shift_id: int):
+    """Metrics from the stored track. May raise archive.ArchiveError."""
+    return compute(*track_arrays(db, shift_id))
+
+
+def _cache(db, shift_id: int, metrics):
+    db.merge(models.ShiftMetrics(shift_id=shift_id, computed_at=datetime.utcnow(), **metrics))
+
+
+def refresh(db, shift_id: int):
+    """Recomputes and caches a completed shift's metrics. The caller commits."""
+    metrics = compute_shift(db, shift_id)
+    _cache(db, shift_id, metrics)
+    return metrics
+
+
+def shift_metrics(db, shift_id: int):
+    """A shift's metrics: from the cache once it is completed, computed (not cached) otherwise. Read-only."""
+    shift = db.get(models.Shift, shift_id)
+    if shift is None:
+        return None
+    cached = db.get(models.ShiftMetrics, shift_id) if shift.status == "completed" else None
+    if cached is not None:
+        return {name: getattr(cached, name) for name in METRIC_FIELDS}
+    return compute_shift(db, shift_id)
+
+
+def _completed_shifts(start: datetime = None, end: datetime = None, worker_id: int = None):
+    """Filter conditions on `shifts`: completed, started in [start, end)."""
+    conditions = [models.Shift.status == "completed"]
+    if start is not None:
+        conditions.append(models.Shift.start_time >= start)
+    if end is not None:
+        conditions.append(models.Shift.start_time < end)
+    if worker_id:
+        conditions.append(models.Shift.user_id == worker_id)
+    return conditions
+
+
+def _uncached(db, start: datetime = None, end: datetime = None, worker_id: int = None):
+    """Query for completed shifts in [start, end) with no cached metrics."""
+    return db.query(models.Shift.id).outerjoin(
+        models.ShiftMetrics, models.ShiftMetrics.shift_id == models.Shift.id
+    ).filter(*_completed_shifts(start, end, worker_id), models.ShiftMetrics.shift_id.is_(None))
+
+
+def fill_cache(db, start: datetime = None, end: datetime = None, worker_id: int = None):
+    """Computes the metrics of completed shifts in [start, end) that have none cached. Commits per batch.
+
+    Archived shifts whose file can't be read are skipped (and retried next time).
+    """
+    missing = _uncached(db, start, end, worker_id).order_by(models.Shift.id).all()
+    unavailable = 0
+    for index, (shift_id,) in enumerate(missing, 1):
+        try:
+            refresh(db, shift_id)
+        except archive.ArchiveError:
+            unavailable += 1
+        if index % CACHE_BATCH_SIZE == 0:
+            db.commit()
+    db.commit()
+    return {"shifts": len(missing) - unavailable, "unavailable_shifts": unavailable}
+
+
+def backfill():
+    """fill_cache over every shift in its own session (startup background job)."""
+    db = database.SessionLocal()
+    try:
+        result = fill_cache(db)
+        if result["shifts"]:
+            print(f">>> MML-SYSTEM: Cached metrics of {result['shifts']} shift(s)")
+    finally:
+        db.close()
+
+
+def distance_summary(db, worker_id: int = None, start: datetime = None, end: datetime = None):
+    """Per-worker totals over completed shifts started in [start, end), like queries.hours_summary. Read-only.
+
+    Summed in SQL over the cache; the few shifts not cached yet are computed on the fly.
+    """
+    cached = models.ShiftMetrics
+    query = db.query(
+        models.User.id,
+        models.User.full_name,
+        models.User.worker_number,
+        func.count(cached.shift_id).label("shift_count"),
+        func.sum(cached.distance_m).label("distance_m"),
+        func.sum(cached.moving_seconds).label("moving_seconds"),
+        func.sum(cached.idle_seconds).label("idle_seconds"),
+        func.max(cached.max_speed_kmh).label("max_speed_kmh"),
+        func.sum(cached.avg_speed_kmh * cached.moving_seconds).label("moving_km_seconds")  # avg speed x moving time
+    ).join(models.Shift, models.Shift.id == cached.shift_id).join(models.User, models.User.id == models.Shift.user_id).filter(
+        *_completed_shifts(start, end, worker_id)
+    )
+    totals = {
+        row.id: row._asdict()
+        for row in query.group_by(models.User.id, models.User.full_name, models.User.worker_number)
+    }
+
+    uncached = _uncached(db, start, end, worker_id).join(models.User, models.User.id == models.Shift.user_id).with_entities(
+        models.Shift.id, models.User.id.label("user_id"), models.User.full_name, models.User.worker_number
+    )
+    for shift_id, user_id, full_name, worker_number in uncached:
+        try:
+            metrics = compute_shift(db, shift_id)
+        except archive.ArchiveError:
+            continue  # Left out until its file is readable, as before it was cached
+        total = totals.setdefault(user_id, {
+            "id": user_id, "full_name": full_name, "worker_number": worker_number, "shift_count": 0, "distance_m": 0.0,
+            "moving_seconds": 0.0, "idle_seconds": 0.0, "max_speed_kmh": 0.0, "moving_km_seconds": 0.0
+        })
+        total["shift_count"] += 1
+        total["distance_m"] += metrics["distance_m"]
+        total["moving_seconds"] += metrics["moving_seconds"]
+        total["idle_seconds"] += metrics["idle_seconds"]
+        total["max_speed_kmh"] = max(total["max_speed_kmh"], metrics["max_speed_kmh"])
+        total["moving_km_seconds"] += metrics["avg_speed_kmh"] * metrics["moving_seconds"]
+
+    rows = sorted(totals.values(), key=lambda row: (row["worker_number"] is None, row["worker_number"] or 0, row["id"]))
+    return [{
+        "worker_name": row["full_name"],
+        "worker_number": row["worker_number"],
+        "shift_count": row["shift_count"],
+        "distance_km": row["distance_m"] / 1000,
+        "moving_hours": row["moving_seconds"] / 3600,
+        "idle_hours": row["idle_seconds"] / 3600,
+        "max_speed_kmh": row["max_speed_kmh"],
+        "avg_speed_kmh": row["moving_km_seconds"] / row["moving_seconds"] if row["moving_seconds"] else 0.0
+    } for row in rows]
+
+
+if __name__ == "__main__":
+    # python shift_metrics.py [--from YYYY-MM-DD] [--to YYYY-MM-DD]   caches metrics of completed shifts
+    args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+    db = database.SessionLocal()
+    try:
+        start, end = exports.parse_range(args.get("--from"), args.get("--to"))
+        result = fill_cache(db, start, end)
+        print(f"Computed metrics for {result['shifts']} shift(s)")
+    finally:
+        db.close()
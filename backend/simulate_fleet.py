@@ -0,0 +1,238 @@
+"""Fleet load generator: N synthetic riders plus admin panels against a running API.
+
+Each rider registers (or reuses its account), logs in, starts a shift, rides with
+stops while pinging /location at the interval the server recommends
+(`next_ping_seconds`), ends the shift after --shift-minutes, takes a break and
+starts again until --duration runs out. Admin panels poll the dashboard endpoints at
+their usual refresh rates meanwhile. Prints throughput and p50/p95/p99 latency per
+endpoint.
+
+    python simulate_fleet.py --url http://localhost:8000 --riders 100 --duration 120
+    python simulate_fleet.py --local --riders 200 --time-scale 10     # own uvicorn on a fresh SQLite file
+    python simulate_fleet.py --local --server-env MML_WRITE_BEHIND=1 --fixed-interval 15
+
+--time-scale speeds up the riders' clock (pings, shift length, breaks); server-side
+timers such as the idle backoff still run in real time. Needs httpx (and uvicorn for --local).
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+CENTER = (42.5987, -5.5671)  # León, same default as the admin panel map
+PASSWORD = "worker123"
+METRES_PER_DEGREE = 111_320
+
+# (endpoint, path, query params, seconds between polls) per open admin panel
+ADMIN_POLLS = (
+    ("GET /admin/workers-map", "/admin/workers-map", None, 2),
+    ("GET /admin/workers-map/nearest", "/admin/workers-map/nearest", {"lat": CENTER[0], "lng": CENTER[1], "k": 5}, 10),
+    ("GET /admin/stats", "/admin/stats", None, 10),
+    ("GET /admin/shifts", "/admin/shifts", {"order": "recent", "limit": 100}, 15),
+    ("GET /admin/alerts/open_shifts", "/admin/alerts/open_shifts", None, 30),
+    ("GET /admin/reports/hours_summary", "/admin/reports/hours_summary", None, 60),
+    ("GET /admin/reports/distance_summary", "/admin/reports/distance_summary", None, 60),
+)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.intervals = []
+
+    async def call(self, client, endpoint, method, path, expected=(200,), **kwargs):
+        """Response, or None on a transport error. Statuses outside `expected` count as errors."""
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors[endpoint][type(e).__name__] += 1
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - started)
+        if response.status_code not in expected:
+            self.errors[endpoint][response.status_code] += 1
+        return response
+
+    def report(self, elapsed):
+        print(f"{'endpoint':<36} | {'requests':>8} | {'req/s':>7} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7} | "
+              f"{'max ms':>7} | errors")
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            samples = sorted(self.latencies[endpoint])
+            pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000 if samples else 0.0
+            errors = self.errors[endpoint]
+            print(f"{endpoint:<36} | {len(samples):>8} | {len(samples) / elapsed:>7.1f} | {pick(0.5):>7.1f} | "
+                  f"{pick(0.95):>7.1f} | {pick(0.99):>7.1f} | {pick(1.0):>7.1f} | "
+                  + (", ".join(f"{code} x{count}" for code, count in errors.most_common()) if errors else "0"))
+        if self.intervals:
+            print(f"next_ping_seconds: avg {sum(self.intervals) / len(self.intervals):.1f}, "
+                  f"min {min(self.intervals)}, max {max(self.intervals)}")
+
+
+class Rider:
+    """Position of one synthetic rider: rides at 15-45 km/h between 1-6 minute stops."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.lat = CENTER[0] + rng.uniform(-0.03, 0.03)
+        self.lng = CENTER[1] + rng.uniform(-0.03, 0.03)
+        self.heading = rng.uniform(0, 2 * math.pi)
+        self.stopped_for = 0.0
+
+    def advance(self, seconds):
+        if self.stopped_for > 0:
+            self.stopped_for -= seconds
+            return
+        if self.rng.random() < 0.04 * seconds / 15:
+            self.stopped_for = self.rng.uniform(60, 360)
+        self.heading += self.rng.gauss(0, 0.4)
+        metres = self.rng.uniform(15, 45) / 3.6 * seconds
+        self.lat += metres * math.cos(self.heading) / METRES_PER_DEGREE
+        self.lng += metres * math.sin(self.heading) / (METRES_PER_DEGREE * math.cos(math.radians(self.lat)))
+
+
+async def run_rider(client, recorder, args, index, stop_at):
+    rng = random.Random(args.seed * 100003 + index)
+    email = f"fleet{index}@sim.local"
+    scale = args.time_scale
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+
+    await recorder.call(client, "POST /register", "POST", "/register", expected=(200, 400), json={
+        "email": email, "password": PASSWORD, "full_name": f"Fleet rider {index}", "worker_number": 10000 + index
+    })
+    response = await recorder.call(client, "POST /token", "POST", "/token", data={"username": email, "password": PASSWORD})
+    if response is None or response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    await recorder.call(client, "GET /users/me", "GET", "/users/me", headers=headers)
+
+    rider = Rider(rng)
+    while time.monotonic() < stop_at:
+        # 400: a shift left open by an earlier run is simply carried on
+        await recorder.call(client, "POST /shifts/start", "POST", "/shifts/start", expected=(200, 400), headers=headers)
+        shift_ends = min(stop_at, time.monotonic() + args.shift_minutes * 60 * rng.uniform(0.8, 1.2) / scale)
+        interval = args.fixed_interval or 15
+        while time.monotonic() < shift_ends:
+            rider.advance(interval)
+            response = await recorder.call(client, "POST /location", "POST", "/location", headers=headers,
+                                           json={"latitude": rider.lat, "longitude": rider.lng})
+            if response is not None and response.status_code == 200 and not args.fixed_interval:
+                interval = response.json().get("next_ping_seconds", 15)
+                recorder.intervals.append(interval)
+            await asyncio.sleep(max(0.0, min(interval / scale, shift_ends - time.monotonic())))
+        await recorder.call(client, "POST /shifts/end", "POST", "/shifts/end", headers=headers)
+        await asyncio.sleep(max(0.0, min(args.break_minutes * 60 / scale, stop_at - time.monotonic())))
+
+
+async def run_admin(client, recorder, args, stop_at):
+    response = await recorder.call(client, "POST /token", "POST", "/token",
+                                   data={"username": args.admin_email, "password": args.admin_password})
+    if response is None or response.status_code != 200:
+        print(f"Admin login failed ({response.status_code if response is not None else 'no response'}), no panel load")
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def poll(endpoint, path, params, period):
+        await asyncio.sleep(random.uniform(0, 1))  # Everything loads when the panel opens
+        while time.monotonic() < stop_at:
+            await recorder.call(client, endpoint, "GET", path, params=params, headers=headers)
+            await asyncio.sleep(max(0.0, min(period, stop_at - time.monotonic())))
+
+    await asyncio.gather(*[poll(*entry) for entry in ADMIN_POLLS])
+
+
+async def wait_ready(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(f"{base_url}/openapi.json")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("API did not start")
+
+
+async def simulate(base_url, args):
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.riders + 20, max_keepalive_connections=args.riders + 20)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        started = time.monotonic()
+        stop_at = started + args.duration
+        await asyncio.gather(
+            *[run_admin(client, recorder, args, stop_at) for _ in range(args.admins)],
+            *[run_rider(client, recorder, args, index, stop_at) for index in range(1, args.riders + 1)]
+        )
+        elapsed = time.monotonic() - started
+    print(f"{args.riders} riders, {args.admins} admin panel(s), {elapsed:.0f} s"
+          + (f", rider clock x{args.time_scale:g}" if args.time_scale != 1 else "")
+          + (f", fixed {args.fixed_interval} s pings" if args.fixed_interval else ", server-recommended ping intervals"))
+    recorder.report(elapsed)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_local(args):
+    """Starts uvicorn (one worker) on a fresh SQLite file and runs the simulation against it."""
+    workdir = tempfile.mkdtemp(prefix="mml_fleet_")
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'fichaje.db')}")
+    env.update(item.split("=", 1) for item in args.server_env)
+    port = free_port()
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log:
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                                  cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            asyncio.run(wait_ready(base_url))
+            asyncio.run(simulate(base_url, args))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+    print(f"Server log and database: {workdir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--local", action="store_true", help="Start a local uvicorn on a fresh SQLite file instead of --url")
+    parser.add_argument("--server-env", nargs="*", default=[], metavar="KEY=VALUE", help="Environment for the --local server")
+    parser.add_argument("--riders", type=int, default=50)
+    parser.add_argument("--admins", type=int, default=1, help="Admin panels open at the same time")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of load")
+    parser.add_argument("--ramp", type=float, default=10, help="Seconds over which riders log in")
+    parser.add_argument("--time-scale", type=float, default=1, help="Rider clock speed-up")
+    parser.add_argument("--shift-minutes", type=float, default=240)
+    parser.add_argument("--break-minutes", type=float, default=30)
+    parser.add_argument("--fixed-interval", type=int, default=0, help="Ping every N seconds, ignoring next_ping_seconds")
+    parser.add_argument("--admin-email", default="admin@fichaje.com")
+    parser.add_argument("--admin-password", default="admin123")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.local:
+        run_local(args)
+    else:
+        asyncio.run(simulate(args.url, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -46,12 +46,13 @@ try:
         lat += random.uniform(-0.001, 0.001)
         lng += random.uniform(-0.001, 0.001)
         
-        requests.post(f"{API_URL}/location", json={
+        resp = requests.post(f"{API_URL}/location", json={
             "latitude": lat,
             "longitude": lng
         }, headers=headers)
         
-        print(f"Ping: {lat:.4f}, {lng:.4f}")
+        # The app waits next_ping_seconds; the demo keeps pinging every 2 s so the map moves
+        print(f"Ping: {lat:.4f}, {lng:.4f} (server suggests next in {resp.json().get('next_ping_seconds')} s)")
         time.sleep(2)
 except KeyboardInterrupt:
     requests.post(f"{API_URL}/shifts/end", headers=headers)
@@ -0,0 +1,54 @@
+import itertools
+import os
+import sys
+import tempfile
+
+# main.py runs the migrations against ./fichaje.db at import time: each test session gets a
+# fresh database in a temporary directory, and cheap bcrypt hashes
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+os.environ.setdefault("MML_BCRYPT_ROUNDS", "4")
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+import database
+import main
+import models
+
+_worker_numbers = itertools.count(1000)  # Clear of the benchmark seed's 1-70 and the admin's 999
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    token = client.post("/token", data={"username": "admin@fichaje.com", "password": "admin123"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def login(client, email, password="pw123456"):
+    token = client.post("/token", data={"username": email, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def worker(client):
+    """(headers, shift id) of a newly registered worker on an active shift."""
+    number = next(_worker_numbers)
+    email = f"rider{number}@test.com"
+    response = client.post("/register", json={"email": email, "password": "pw123456", "full_name": f"Rider {number}", "worker_number": number})
+    response.raise_for_status()
+    headers = login(client, email)
+    shift = client.post("/shifts/start", headers=headers)
+    shift.raise_for_status()
+    return headers, shift.json()["id"]
+
+
+def stored_locations(shift_id):
+    with database.SessionLocal() as db:
+        return db.scalar(select(func.count()).select_from(models.LocationLog).where(models.LocationLog.shift_id == shift_id))
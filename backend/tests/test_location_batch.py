@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+import database
+import ingest_buffer
+import main
+from conftest import stored_locations
+
+
+def batch(*offsets, spacing_s=10):
+    """Fixes every `spacing_s` just after the shift started, `offsets` metres north of the first."""
+    start = datetime.utcnow() + timedelta(seconds=1)
+    return {"locations": [
+        {"latitude": 42.5987 + metres / 111320, "longitude": -5.5671, "timestamp": (start + timedelta(seconds=spacing_s * i)).isoformat()}
+        for i, metres in enumerate(offsets)
+    ]}
+
+
+def test_retried_stationary_batch_stores_nothing(client, worker):
+    # A rider waiting at a restaurant: the filter stores the first fix and holds back the rest
+    headers, shift_id = worker
+    waiting = batch(*[0.1 * i for i in range(8)])
+    assert client.post("/location/batch", json=waiting, headers=headers).json()["accepted"] == 8
+    stored = stored_locations(shift_id)
+
+    client.post("/location/batch", json=waiting, headers=headers)
+    assert stored_locations(shift_id) == stored
+
+
+def test_retry_after_the_dwell_ended_is_all_duplicates(client, worker):
+    headers, shift_id = worker
+    waited_then_left = batch(0, 0.2, 0.4, 0.6, 0.8, 1.0, 200)
+    client.post("/location/batch", json=waited_then_left, headers=headers)
+    stored = stored_locations(shift_id)
+
+    retry = client.post("/location/batch", json=waited_then_left, headers=headers).json()
+    assert retry["accepted"] == 0
+    assert {result["reason"] for result in retry["results"]} == {"duplicate"}
+    assert stored_locations(shift_id) == stored
+
+
+def test_retry_before_the_write_behind_flush_is_all_duplicates(client, worker, monkeypatch):
+    headers, shift_id = worker
+    buffer = ingest_buffer.LocationWriteBuffer(database.SessionLocal, flush_interval_ms=2000)
+    buffer.start()
+    monkeypatch.setattr(main, "write_buffer", buffer)
+    riding = batch(0, 100, 200)
+    try:
+        assert client.post("/location/batch", json=riding, headers=headers).json()["accepted"] == 3
+        assert stored_locations(shift_id) == 0  # Still queued
+
+        assert client.post("/location/batch", json=riding, headers=headers).json()["accepted"] == 0
+    finally:
+        buffer.stop()
+    assert stored_locations(shift_id) == 3
@@ -0,0 +1,73 @@
+"""The shift views issue a constant number of SQL queries, whatever the shift count.
+
+Seeds a small and a large dataset, calls each view through the test client and counts
+statements on the engine.
+"""
+import pytest
+from sqlalchemy import event, text
+import database
+import main
+import rollups
+from benchmarks.seed import EPOCH, seed
+from conftest import login
+
+VIEWS = {
+    "all shifts": ("/admin/shifts", {}),
+    "all shifts (filtered)": ("/admin/shifts", {"status": "completed", "incident_type": "retraso"}),
+    "daily": (f"/admin/shifts/daily/{EPOCH.date().isoformat()}", {}),
+    "weekly": (f"/admin/shifts/weekly/{EPOCH.isocalendar()[0]}/{EPOCH.isocalendar()[1]}", {}),
+    "monthly": (f"/admin/shifts/monthly/{EPOCH.year}/{EPOCH.month}", {"worker_id": 5}),
+    "hours summary": ("/admin/reports/hours_summary", {}),
+    "hours summary (rollup)": ("/admin/reports/hours_summary", {"source": "rollup"}),
+}
+
+
+def reseed(days):
+    with database.engine.begin() as conn:
+        for table in ("worker_daily_hours", "locations", "shifts", "users"):
+            conn.execute(text(f"DELETE FROM {table}"))
+    counts = seed(database.engine, users=70, days=days, locations=0)
+    # Seeding bypasses /shifts/end and the startup loads, so rebuild what they maintain
+    db = database.SessionLocal()
+    try:
+        rollups.rebuild(db)
+        db.commit()
+        main.shift_registry.load(db)
+        main.live_positions.load(db)
+    finally:
+        db.close()
+    main.principal_cache.invalidate()
+    return counts
+
+
+@pytest.fixture(scope="module")
+def query_counts(client):
+    """{view: statement count} for a small and a large dataset."""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    results = []
+    event.listen(database.engine, "before_cursor_execute", count)
+    try:
+        for days in (5, 60):
+            shifts = reseed(days)["shifts"]
+            headers = login(client, "admin@fichaje.com", "admin123")
+            counts = {}
+            for name, (path, params) in VIEWS.items():
+                client.get(path, params=params, headers=headers)  # Warm the principal cache
+                statements.clear()
+                client.get(path, params=params, headers=headers).raise_for_status()
+                counts[name] = len(statements)
+            results.append((shifts, counts))
+    finally:
+        event.remove(database.engine, "before_cursor_execute", count)
+    return results
+
+
+@pytest.mark.parametrize("view", VIEWS)
+def test_view_queries_do_not_grow_with_shifts(query_counts, view):
+    (small_shifts, small), (large_shifts, large) = query_counts
+    assert small_shifts < large_shifts
+    assert small[view] == large[view]
@@ -0,0 +1,26 @@
+import database
+import main
+import models
+from conftest import login
+
+
+def test_deleting_a_worker_on_shift_closes_it(client, admin_headers, worker):
+    headers, shift_id = worker
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    active = len(main.shift_registry)
+
+    assert client.delete(f"/admin/workers/{user_id}", headers=admin_headers).status_code == 200
+    assert main.shift_registry.get(user_id) is None
+    assert len(main.shift_registry) == active - 1
+    with database.SessionLocal() as db:
+        shift = db.get(models.Shift, shift_id)
+        assert shift.status == "completed"
+        assert shift.user_id is None
+
+    # SQLite hands the highest rowid out again: the next worker must not inherit the shift
+    client.post("/register", json={"email": "reused@test.com", "password": "pw123456", "full_name": "Reused", "worker_number": 500}).raise_for_status()
+    reused = login(client, "reused@test.com")
+    assert client.get("/users/me", headers=reused).json()["id"] == user_id
+    started = client.post("/shifts/start", headers=reused)
+    assert started.status_code == 200
+    assert started.json()["id"] != shift_id
@@ -0,0 +1,332 @@
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import groupby
+from sqlalchemy import exists, func, or_, select
+import models
+import queries
+import archive
+import track_codec
+import database
+
+_UNIX_EPOCH = datetime(1970, 1, 1)
+
+# GPS tracks of closed shifts are compacted from `locations` rows into one encoded
+# `shift_tracks` blob per shift, and after RETENTION_DAYS moved to read-only archive
+# files (archive.py). Reads go through this module and handle every representation,
+# so a shift may be raw, compacted, (briefly) a mix of the two, or archived.
+# Archiving is not scheduled by the API: run `python tracks.py --archive` (cron or by
+# hand) on the host where MML_ARCHIVE_DIR is mounted.
+COMPACT_ON_CLOSE = os.getenv("MML_COMPACT_TRACKS", "1") == "1"
+EXPORT_BATCH_SIZE = 50  # Compacted tracks per fetch (one blob is ~20 KB for a 10 h shift)
+
+RETENTION_DAYS = int(os.getenv("MML_RETENTION_DAYS", "30"))
+ARCHIVE_BATCH_SHIFTS = int(os.getenv("MML_ARCHIVE_BATCH_SHIFTS", "100"))
+# Hot rows of archived shifts are deleted this many at a time, one short transaction each,
+# with a pause in between so request writes are never queued behind a long SQLite lock.
+ARCHIVE_DELETE_CHUNK = int(os.getenv("MML_ARCHIVE_DELETE_CHUNK", "2000"))
+ARCHIVE_PAUSE_MS = int(os.getenv("MML_ARCHIVE_PAUSE_MS", "20"))
+
+
+def _raw_points(db, shift_id: int):
+    return db.query(
+        models.LocationLog.id, models.LocationLog.timestamp, models.LocationLog.latitude, models.LocationLog.longitude
+    ).filter(models.LocationLog.shift_id == shift_id).order_by(models.LocationLog.timestamp, models.LocationLog.id).all()
+
+
+def _hot_points(db, shift_id: int):
+    track = db.get(models.ShiftTrack, shift_id)
+    points = track_codec.decode(track.encoded) if track else []
+    raw = [(row.timestamp, row.latitude, row.longitude) for row in _raw_points(db, shift_id)]
+    if raw:
+        points = sorted(points + raw, key=lambda point: point[0])
+    return points
+
+
+def _encoded_track(db, shift_id: int):
+    """(blob, point count) of a shift's hot track; the stored blob as-is when there are no raw rows."""
+    track = db.get(models.ShiftTrack, shift_id)
+    if track and not db.query(exists().where(models.LocationLog.shift_id == shift_id)).scalar():
+        return track.encoded, track.point_count
+    points = _hot_points(db, shift_id)
+    return track_codec.encode(points), len(points)
+
+
+def compact_shift(db, shift_id: int):
+    """Moves a shift's `locations` rows into its encoded track. Returns the point count. The caller commits."""
+    raw = _raw_points(db, shift_id)
+    if not raw:
+        return 0
+    track = db.get(models.ShiftTrack, shift_id)
+    points = [(row.timestamp, row.latitude, row.longitude) for row in raw]
+    if track:
+        # Fixes that arrived after an earlier compaction
+        points = sorted(track_codec.decode(track.encoded) + points, key=lambda point: point[0])
+    else:
+        track = models.ShiftTrack(shift_id=shift_id)
+        db.add(track)
+
+    track.encoded = track_codec.encode(points)
+    track.point_count = len(points)
+    track.started_at = points[0][0]
+    track.ended_at = points[-1][0]
+    db.query(models.LocationLog).filter(
+        models.LocationLog.shift_id == shift_id,
+        models.LocationLog.id <= max(row.id for row in raw)
+    ).delete(synchronize_session=False)
+    return len(points)
+
+
+def compact_closed_shifts(db, batch_size=100):
+    """Compacts every completed shift that still has raw rows (backfill). Commits per batch."""
+    pending = db.query(models.LocationLog.shift_id).join(
+        models.Shift, models.Shift.id == models.LocationLog.shift_id
+    ).filter(models.Shift.status == "completed", models.Shift.archive_path.is_(None)).distinct().all()
+    shifts = points = 0
+    for index, (shift_id,) in enumerate(pending, 1):
+        points += compact_shift(db, shift_id)
+        shifts += 1
+        if index % batch_size == 0:
+            db.commit()
+    db.commit()
+    return {"shifts": shifts, "points": points}
+
+
+def track_fixes(db, shift_id: int):
+    """The shift's (timestamp, lat, lng) fixes in time order, whichever representation they are stored in.
+
+    Raises archive.ArchiveError if the shift is archived and its file can't be read.
+    """
+    shift = db.get(models.Shift, shift_id)
+    if shift is not None and shift.archive_path:
+        return archive.read_track(shift.archive_path, shift_id)
+    return _hot_points(db, shift_id)
+
+
+def track_points(db, shift_id: int):
+    return [{"timestamp": t, "latitude": lat, "longitude": lng} for t, lat, lng in track_fixes(db, shift_id)]
+
+
+def track_columns(db, shift_id: int):
+    """(unix seconds, latitudes, longitudes) of the shift's fixes in time order, for analytics.
+
+    Hot tracks skip datetime objects: blobs are decoded straight to numbers and raw rows
+    come back as floats, with the time computed in SQL. Raises archive.ArchiveError like track_fixes.
+    """
+    shift = db.get(models.Shift, shift_id)
+    if shift is None:
+        return [], [], []
+    if shift.archive_path:
+        points = archive.read_track(shift.archive_path, shift_id)
+        return [(t - _UNIX_EPOCH).total_seconds() for t, _, _ in points], [p[1] for p in points], [p[2] for p in points]
+
+    track = db.get(models.ShiftTrack, shift_id)
+    encoded = track_codec.decode_columns(track.encoded) if track else ([], [], [])
+    rows = db.connection().execute(select(
+        queries.seconds_between(models.Shift.start_time, models.LocationLog.timestamp),
+        models.LocationLog.latitude,
+        models.LocationLog.longitude
+    ).join(models.Shift, models.Shift.id == models.LocationLog.shift_id).where(
+        models.LocationLog.shift_id == shift_id
+    ).order_by(models.LocationLog.timestamp, models.LocationLog.id)).all()
+    if not rows:
+        return encoded
+    offset = (shift.start_time - _UNIX_EPOCH).total_seconds()
+    raw = [(offset + seconds, lat, lng) for seconds, lat, lng in rows]
+    if encoded[0]:
+        raw = sorted(list(zip(*encoded)) + raw, key=lambda point: point[0])
+    return tuple(list(column) for column in zip(*raw))
+
+
+def _in_range(timestamp, start, end):
+    return (start is None or timestamp >= start) and (end is None or timestamp < end)
+
+
+def _export_row(shift, timestamp, latitude, longitude):
+    return {
+        "shift_id": shift.shift_id, "worker_id": shift.worker_id, "worker_name": shift.worker_name,
+        "worker_number": shift.worker_number, "timestamp": timestamp, "latitude": latitude, "longitude": longitude
+    }
+
+
+def export_rows(db, start=None, end=None, worker_id: int = None, shift_id: int = None):
+    """Rows of queries.LOCATION_EXPORT_FIELDS: archived tracks, then compacted ones, then raw `locations`."""
+    archived = db.query(
+        models.Shift.id.label("shift_id"),
+        models.Shift.user_id.label("worker_id"),
+        models.User.full_name.label("worker_name"),
+        models.User.worker_number.label("worker_number"),
+        models.Shift.archive_path
+    ).outerjoin(models.User, models.User.id == models.Shift.user_id).filter(models.Shift.archive_path.isnot(None))
+    if start is not None:
+        archived = archived.filter(models.Shift.end_time >= start)
+    if end is not None:
+        archived = archived.filter(models.Shift.start_time < end)
+    if worker_id:
+        archived = archived.filter(models.Shift.user_id == worker_id)
+    if shift_id:
+        archived = archived.filter(models.Shift.id == shift_id)
+
+    for path, shifts in groupby(archived.order_by(models.Shift.archive_path, models.Shift.id), key=lambda row: row.archive_path):
+        shifts = {shift.shift_id: shift for shift in shifts}
+        for archived_id, points in archive.iter_tracks(path, list(shifts)):
+            for timestamp, latitude, longitude in points:
+                if _in_range(timestamp, start, end):
+                    yield _export_row(shifts[archived_id], timestamp, latitude, longitude)
+
+    Track = models.ShiftTrack
+    query = db.query(
+        Track.shift_id,
+        models.Shift.user_id.label("worker_id"),
+        models.User.full_name.label("worker_name"),
+        models.User.worker_number.label("worker_number"),
+        Track.encoded
+    ).join(models.Shift, models.Shift.id == Track.shift_id).outerjoin(
+        models.User, models.User.id == models.Shift.user_id
+    ).filter(models.Shift.archive_path.is_(None))
+    if start is not None:
+        query = query.filter(Track.ended_at >= start)
+    if end is not None:
+        query = query.filter(Track.started_at < end)
+    if worker_id:
+        query = query.filter(models.Shift.user_id == worker_id)
+    if shift_id:
+        query = query.filter(Track.shift_id == shift_id)
+
+    for track in query.order_by(Track.shift_id).yield_per(EXPORT_BATCH_SIZE):
+        for timestamp, latitude, longitude in track_codec.decode(track.encoded):
+            if _in_range(timestamp, start, end):
+                yield _export_row(track, timestamp, latitude, longitude)
+
+    raw = queries.location_export_query(db, start=start, end=end, worker_id=worker_id, shift_id=shift_id).filter(
+        models.Shift.archive_path.is_(None)
+    )
+    for row in raw.yield_per(EXPORT_BATCH_SIZE * 40):
+        yield row._mapping
+
+
+def archive_old_shifts(db, older_than_days: int = RETENTION_DAYS, now: datetime = None):
+    """Moves the tracks of shifts closed more than `older_than_days` ago to archive files.
+
+    Each batch is read, written to one file per start day (verified by reading it back)
+    and the shifts marked archived (from then on reads use the file); the hot rows are
+    removed afterwards by purge_archived. Safe to re-run after an interruption. Raises
+    archive.ArchiveError before touching anything if no persistent location is configured.
+    """
+    archive.require_location()
+    cutoff = (now or datetime.utcnow()) - timedelta(days=older_than_days)
+    Shift = models.Shift
+    has_track = _has_hot_rows()
+    shifts = files = points = 0
+    while True:
+        batch = db.query(Shift.id, Shift.user_id, Shift.start_time, Shift.end_time).filter(
+            Shift.status == "completed", Shift.end_time < cutoff, Shift.archive_path.is_(None), has_track
+        ).order_by(Shift.start_time, Shift.id).limit(ARCHIVE_BATCH_SHIFTS).all()
+        if not batch:
+            break
+        encoded = {row.id: _encoded_track(db, row.id) for row in batch}
+        db.commit()  # Release the read transaction before the file writes
+
+        for day, rows in groupby(batch, key=lambda row: row.start_time.date()):
+            rows = list(rows)
+            path = archive.write_day(day, [({
+                "shift_id": row.id, "worker_id": row.user_id, "start_time": row.start_time,
+                "end_time": row.end_time, "point_count": encoded[row.id][1]
+            }, encoded[row.id][0]) for row in rows])
+            db.query(Shift).filter(Shift.id.in_([row.id for row in rows])).update(
+                {Shift.archive_path: path}, synchronize_session=False
+            )
+            db.commit()
+            files += 1
+        shifts += len(batch)
+        points += sum(count for _, count in encoded.values())
+
+    return dict({"shifts": shifts, "files": files, "points": points}, **purge_archived(db))
+
+
+def _has_hot_rows():
+    return or_(
+        exists().where(models.ShiftTrack.shift_id == models.Shift.id),
+        exists().where(models.LocationLog.shift_id == models.Shift.id)
+    )
+
+
+def _delete_in_chunks(db, model, key, keep_going, chunk_size):
+    deleted = 0
+    while True:
+        chunk = select(key).where(keep_going).limit(chunk_size)
+        count = db.query(model).filter(key.in_(chunk)).delete(synchronize_session=False)
+        db.commit()
+        deleted += count
+        if count < chunk_size:
+            return deleted
+        time.sleep(ARCHIVE_PAUSE_MS / 1000)
+
+
+def purge_archived(db):
+    """Deletes hot rows (`locations`, `shift_tracks`) of archived shifts in short transactions.
+
+    Rows are only deleted for shifts whose archive file reads back intact (archive.verify);
+    files that fail are listed in `unverified_files` and their shifts keep their rows.
+    """
+    archive.require_location()
+    pending = db.query(models.Shift.archive_path, models.Shift.id).filter(
+        models.Shift.archive_path.isnot(None), _has_hot_rows()
+    ).order_by(models.Shift.archive_path, models.Shift.id).all()
+    db.commit()
+
+    deleted = 0
+    unverified = []
+    for path, rows in groupby(pending, key=lambda row: row.archive_path):
+        shift_ids = [row.id for row in rows]
+        try:
+            archive.verify(path, dict.fromkeys(shift_ids))
+        except archive.ArchiveError:
+            unverified.append(path)
+            continue
+        deleted += _delete_in_chunks(
+            db, models.LocationLog, models.LocationLog.id, models.LocationLog.shift_id.in_(shift_ids), ARCHIVE_DELETE_CHUNK
+        )
+        deleted += _delete_in_chunks(
+            db, models.ShiftTrack, models.ShiftTrack.shift_id, models.ShiftTrack.shift_id.in_(shift_ids), ARCHIVE_BATCH_SHIFTS
+        )
+    return {"deleted_rows": deleted, "unverified_files": unverified}
+
+
+def storage_stats(db):
+    compacted = db.query(
+        func.count(models.ShiftTrack.shift_id),
+        func.coalesce(func.sum(models.ShiftTrack.point_count), 0),
+        func.coalesce(func.sum(func.length(models.ShiftTrack.encoded)), 0)
+    ).one()
+    return {
+        "raw_points": db.query(func.count(models.LocationLog.id)).scalar(),
+        "compacted_shifts": compacted[0],
+        "compacted_points": compacted[1],
+        "compacted_bytes": compacted[2],
+        "archived_shifts": db.query(func.count(models.Shift.id)).filter(models.Shift.archive_path.isnot(None)).scalar(),
+    }
+
+
+if __name__ == "__main__":
+    # python tracks.py             compacts the tracks of every completed shift
+    # python tracks.py --archive   archives tracks of shifts closed over MML_RETENTION_DAYS ago
+    # python tracks.py --status
+    db = database.SessionLocal()
+    try:
+        if "--archive" in sys.argv:
+            try:
+                result = archive_old_shifts(db)
+            except archive.ArchiveError as e:
+                sys.exit(f"Not archiving: {e}")
+            print(f"Archived {result['points']} point(s) of {result['shifts']} shift(s) into {result['files']} file(s) "
+                  f"under {archive.ARCHIVE_DIR}; removed {result['deleted_rows']} hot row(s)")
+            for path in result["unverified_files"]:
+                print(f"Kept the hot rows of {path}: the file failed verification")
+        elif "--status" not in sys.argv:
+            result = compact_closed_shifts(db)
+            print(f"Compacted {result['points']} point(s) from {result['shifts']} shift(s)")
+        print(storage_stats(db))
+    finally:
+        db.close()
@@ -55,14 +55,31 @@ class ApiService {
     }
   }
 
-  Future<void> sendLocation(double lat, double lng) async {
+  // Returns the server's recommended seconds until the next ping, or null if the ping failed.
+  Future<int?> sendLocation(double lat, double lng) async {
     try {
-      await _dio.post('/location', data: {
+      final response = await _dio.post('/location', data: {
         'latitude': lat,
         'longitude': lng,
       });
+      return response.data['next_ping_seconds'] as int?;
     } catch (e) {
       print("Location sync failed: $e");
+      return null;
+    }
+  }
+
+  // Flushes buffered fixes ({latitude, longitude, timestamp}) in one request.
+  // Returns the per-fix accept/reject results, or null if the upload failed.
+  Future<Map<String, dynamic>?> sendLocationBatch(List<Map<String, dynamic>> fixes) async {
+    try {
+      final response = await _dio.post('/location/batch', data: {
+        'locations': fixes,
+      });
+      return response.data;
+    } catch (e) {
+      print("Location batch sync failed: $e");
+      return null;
     }
   }
 }
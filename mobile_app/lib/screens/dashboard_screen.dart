@@ -15,6 +15,14 @@ class _DashboardScreenState extends State<DashboardScreen> {
   bool _isShiftActive = false;
   bool _isLoading = false;
   Timer? _locationTimer;
+  static const Duration _defaultPingInterval = Duration(seconds: 15);
+  // Fixes that could not be sent (offline) are kept here and uploaded in one
+  // /location/batch request, at most once a minute. Capped at the server's batch size.
+  static const Duration _flushInterval = Duration(minutes: 1);
+  static const int _maxPendingFixes = 1000;
+  final List<Map<String, dynamic>> _pendingFixes = [];
+  DateTime? _lastFlushAttempt;
+  bool _flushing = false;
   String _statusMessage = "Esperando inicio de jornada...";
 
   Map<String, dynamic>? _userProfile;
@@ -39,7 +47,8 @@ class _DashboardScreenState extends State<DashboardScreen> {
     
     try {
       if (_isShiftActive) {
-        // Stop Shift
+        // Stop Shift (buffered fixes first: the server rejects them once the shift is over)
+        await _flushPendingFixes(api, force: true);
         await api.endShift();
         _locationTimer?.cancel();
         if (mounted) {
@@ -74,17 +83,8 @@ class _DashboardScreenState extends State<DashboardScreen> {
           });
         }
 
-        // 3. Start Tracking (Simple Timer for Demo)
-        _locationTimer = Timer.periodic(const Duration(seconds: 15), (timer) async {
-          if (_isShiftActive) {
-              try {
-                Position position = await Geolocator.getCurrentPosition(desiredAccuracy: LocationAccuracy.high);
-                await api.sendLocation(position.latitude, position.longitude);
-              } catch (e) {
-                print("Error tracking: $e");
-              }
-          }
-        });
+        // 3. Start Tracking (the server says when to ping next: less often when stopped or overloaded)
+        _scheduleNextPing(api, _defaultPingInterval);
       }
     } catch (e) {
       if (mounted) setState(() => _statusMessage = "Error: $e");
@@ -93,6 +93,65 @@ class _DashboardScreenState extends State<DashboardScreen> {
     }
   }
 
+  void _scheduleNextPing(ApiService api, Duration delay) {
+    _locationTimer?.cancel();
+    _locationTimer = Timer(delay, () async {
+      if (!_isShiftActive) return;
+      Duration next = _defaultPingInterval;
+      try {
+        Position position = await Geolocator.getCurrentPosition(desiredAccuracy: LocationAccuracy.high);
+        final Map<String, dynamic> fix = {
+          'latitude': position.latitude,
+          'longitude': position.longitude,
+          'timestamp': DateTime.now().toUtc().toIso8601String(),
+        };
+        if (_pendingFixes.isEmpty) {
+          final seconds = await api.sendLocation(position.latitude, position.longitude);
+          if (seconds != null) {
+            next = Duration(seconds: seconds.clamp(5, 300));
+          } else {
+            _bufferFix(fix);
+          }
+        } else {
+          // Keep the order: this fix goes after the ones still waiting
+          _bufferFix(fix);
+          await _flushPendingFixes(api);
+        }
+      } catch (e) {
+        print("Error tracking: $e");
+      }
+      if (_isShiftActive) _scheduleNextPing(api, next);
+    });
+  }
+
+  void _bufferFix(Map<String, dynamic> fix) {
+    if (_pendingFixes.length >= _maxPendingFixes) _pendingFixes.removeAt(0);
+    _pendingFixes.add(fix);
+    if (mounted) setState(() => _statusMessage = "Sin conexión: ${_pendingFixes.length} ubicaciones pendientes.");
+  }
+
+  // Uploads the buffered fixes once a minute (or now, with force). They are only dropped
+  // once the server has answered; a retry after a lost response is deduplicated server-side.
+  Future<void> _flushPendingFixes(ApiService api, {bool force = false}) async {
+    if (_pendingFixes.isEmpty || _flushing) return;
+    final now = DateTime.now();
+    if (!force && _lastFlushAttempt != null && now.difference(_lastFlushAttempt!) < _flushInterval) return;
+    _flushing = true;
+    _lastFlushAttempt = now;
+    try {
+      final sent = List<Map<String, dynamic>>.from(_pendingFixes);
+      final result = await api.sendLocationBatch(sent);
+      if (result == null) return;
+      final uploaded = Set<Map<String, dynamic>>.identity()..addAll(sent);
+      _pendingFixes.removeWhere(uploaded.contains);
+      if (mounted && _pendingFixes.isEmpty) {
+        setState(() => _statusMessage = "Jornada ACTIVA. Rastreando ubicación.");
+      }
+    } finally {
+      _flushing = false;
+    }
+  }
+
   @override
   Widget build(BuildContext context) {
     final bool isActive = _isShiftActive;